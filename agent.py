@@ -1,22 +1,35 @@
+import argparse
 import asyncio
 import os 
 import sys
 import json
+import re
+import time
+import uuid
 from contextlib import AsyncExitStack
-from typing import Optional,List
+from typing import Dict,Optional,List
 from newprompt import agent1,agent2
-from voice import transcribe,record_audio
+from pipeline import CWD_TOOLS, PLAN_FORMAT, run_pipelined
+from sessions import SESSION_HEADER
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
 
 
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
 from langchain_mcp_adapters.tools import load_mcp_tools
-from langgraph.prebuilt import create_react_agent
+from agent_graph import build_react_agent
+from context import ContextManager
+from llm_cache import MODES as CACHE_MODES, LLMCache
+from metrics import Metrics, MetricsDumper
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.checkpoint.memory import InMemorySaver
+from checkpoints import SQLiteSaver
 from dotenv import load_dotenv
 load_dotenv()
+# Replaced by make_checkpointer() with a SQLiteSaver unless --checkpoint-db is empty
 checkpointer = InMemorySaver()
 
 # class CustomEncoder(json.JSONEncoder):
@@ -60,16 +73,78 @@ llm = ChatGoogleGenerativeAI(
 )
 
 
-if len(sys.argv) < 2:
-    print("usuage python client_langchain_google_genai_bind_tools.py <path_to_server_script>")
-    sys.exit(1)
-server_script=sys.argv[1]
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Planning + implementation agents over an MCP workspace server",
+        usage="python agent.py <path_to_server_script | http://127.0.0.1:8765/mcp> [options]",
+    )
+    parser.add_argument("server", help="server script to spawn over stdio, or the URL of a server "
+                                       "started with `python mcp_server.py --http` to reuse it across sessions")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="wait for each agent to finish and print the whole response as JSON (old behaviour)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="start implementing planned tasks while the planner is still writing the plan")
+    parser.add_argument("--parallel", type=int, default=2,
+                        help="max independent tasks implemented at the same time in --pipeline mode")
+    parser.add_argument("--tool-concurrency", type=int, default=4,
+                        help="max read-only tool calls from one model turn run at the same time")
+    parser.add_argument("--transcript", default="transcript.jsonl",
+                        help="JSONL file the streamed messages are appended to")
+    parser.add_argument("--max-context-tokens", type=int, default=24000,
+                        help="summarize older turns once the estimated prompt grows past this (0 disables)")
+    parser.add_argument("--max-tool-chars", type=int, default=16000,
+                        help="longer tool results are shortened; the agent can page the rest back in")
+    parser.add_argument("--session",
+                        help="with a server URL: name of the workspace session to use, so its current "
+                             "directory and processes are kept when the agent reconnects")
+    parser.add_argument("--llm-cache", metavar="PATH",
+                        help="SQLite file of model responses; identical model calls are answered from it")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="cache",
+                        help="with --llm-cache: cache (reuse, call on miss), record (always call and store) "
+                             "or replay (recorded responses only, fail on a miss - for offline regression runs)")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run the queries in FILE ('-' for stdin) concurrently instead of prompting: "
+                             "one per line, as plain text or JSON like {\"id\": \"todo\", \"query\": \"...\"}")
+    parser.add_argument("--workers", type=int, default=4, help="jobs run at the same time in --batch mode")
+    parser.add_argument("--jobs-dir", default=os.path.expanduser("~/mcp/workspace/jobs"),
+                        help="each --batch job gets its own workspace <jobs-dir>/<id> (with a stdio server; "
+                             "with a server URL, jobs get their own session - start it with --isolate-sessions "
+                             "to also give them their own directory)")
+    parser.add_argument("--batch-output", default="batch_results.jsonl",
+                        help="JSONL file a result line is appended to as each job finishes ('-' for stdout)")
+    parser.add_argument("--checkpoint-db", default="checkpoints.sqlite",
+                        help="SQLite file agent progress is checkpointed to after every step, so timed out or "
+                             "crashed runs can be resumed ('' keeps checkpoints in memory only)")
+    parser.add_argument("--thread",
+                        help="name for this run's checkpoint threads (default: random); queries use <thread>-q<n> "
+                             "and batch jobs <thread>-<id>, so rerunning a batch with the same --thread resumes it")
+    parser.add_argument("--resume", metavar="THREAD_ID",
+                        help="first continue the interrupted query with this thread id from its last completed step")
+    parser.add_argument("--metrics-file",
+                        help="periodically write LLM call metrics (latency, tokens) here: "
+                             "Prometheus text if it ends in .prom, JSONL snapshots otherwise")
+    parser.add_argument("--metrics-interval", type=float, default=60, help="seconds between metrics dumps")
+    parser.add_argument("--voice", action="store_true",
+                        help="speak every query; the next one is recorded and transcribed while the agent "
+                             "is still working on the previous one")
+    parser.add_argument("--voice-timeout", type=float, default=90,
+                        help="max seconds for capturing and transcribing one utterance")
+    return parser.parse_args(argv)
 
 
-server_params= StdioServerParameters(
-    command="python" if server_script.endswith(".py") else "node",
-    args=[server_script]
-)
+# Set by configure(): a URL means a long-lived server (mcp_server.py --http)
+# that we connect to instead of spawning a new one over stdio every run.
+server_url = None
+server_params = None
+
+
+def configure(server_script: str) -> None:
+    global server_url, server_params
+    server_url = server_script if server_script.startswith(("http://", "https://")) else None
+    server_params= StdioServerParameters(
+        command="python" if server_script.endswith(".py") else "node",
+        args=[server_script]
+    )
 
 
 # Global variable to hold the active MCP session.
@@ -101,65 +176,485 @@ def get_last_message(response):
     return  content
 
 
-async def run_agent():
+def message_text(content) -> str:
+    """Text of a message or chunk; Gemini sometimes returns a list of content parts."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(p if isinstance(p, str) else p.get("text", "") for p in content
+                       if isinstance(p, str) or p.get("type") == "text")
+    return str(content)
+
+
+class TranscriptWriter:
+    """Appends every message to a JSONL file as soon as it is produced."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+        self.index = 0
+        self.encoder = CustomEncoder()
+
+    def write(self, message, agent: str) -> None:
+        self.index += 1
+        record = self.encoder.default(message)
+        record["_index"] = self.index
+        record["agent"] = agent
+        self.file.write(json.dumps(record, cls=CustomEncoder) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class LLMMetrics(BaseCallbackHandler):
+    """Records chat model call latency and token usage (set as the model's callbacks)."""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.started: Dict[object, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        name = (kwargs.get("invocation_params") or {}).get("model") or (serialized or {}).get("name", "llm")
+        self.started[run_id] = (str(name), time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        name, start = self.started.pop(run_id, ("llm", time.perf_counter()))
+        usage = {}
+        for generations in response.generations:
+            for g in generations:
+                usage = getattr(getattr(g, "message", None), "usage_metadata", None) or usage
+        self.metrics.observe("llm", name, (time.perf_counter() - start) * 1000,
+                             input_tokens=usage.get("input_tokens", 0),
+                             output_tokens=usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        name, start = self.started.pop(run_id, ("llm", time.perf_counter()))
+        self.metrics.observe("llm", name, (time.perf_counter() - start) * 1000, error=True)
+
+
+async def stream_agent(agent, messages, config, label: str, transcript: TranscriptWriter,
+                       on_token=None, echo_tokens: bool = True):
+    """
+    Run an agent graph and print its output as it happens: model tokens as they
+    arrive, then each tool call and (shortened) tool result. Every finished
+    message is written to the transcript right away. Returns the last message.
+
+    on_token, if given, is called with every chunk of model text. Set
+    echo_tokens=False when several agents stream at once so their tokens
+    don't interleave on the console.
+    """
+    if isinstance(messages, str):
+        messages = [HumanMessage(content=messages)]
+    for m in messages or []:
+        transcript.write(m, label)
+
+    print(f"\n[{label}]" + (" (resumed)" if messages is None else ""))
+    last = None
+    streamed = False
+    # None continues the checkpointed run of this thread from its last completed step
+    inputs = None if messages is None else {"messages": messages}
+    async for mode, chunk in agent.astream(inputs, config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            msg, _ = chunk
+            if isinstance(msg, AIMessageChunk):
+                text = message_text(msg.content)
+                streamed = streamed or bool(text)
+                if text and on_token is not None:
+                    on_token(text)
+                if text and echo_tokens:
+                    print(text, end="", flush=True)
+            continue
+
+        for node, update in chunk.items():
+            msgs = (update or {}).get("messages", []) if isinstance(update, dict) else []
+            if node == "agent":
+                # Anything before the response is context trimming of earlier history
+                msgs = msgs[-1:]
+            for msg in msgs:
+                transcript.write(msg, label)
+                last = msg
+                if isinstance(msg, AIMessage) and not streamed:
+                    # Answered from the LLM cache, so no tokens were streamed for it
+                    text = message_text(msg.content)
+                    if text and on_token is not None:
+                        on_token(text)
+                    if text and echo_tokens:
+                        print(text, end="", flush=True)
+                if isinstance(msg, AIMessage):
+                    streamed = False
+                if not echo_tokens and isinstance(msg, AIMessage) and msg.content:
+                    print(f"\n[{label}] {message_text(msg.content)}", flush=True)
+                for call in getattr(msg, "tool_calls", None) or []:
+                    print(f"\n  [{label}] -> {call['name']}({json.dumps(call['args'], default=str)[:200]})", flush=True)
+                if isinstance(msg, ToolMessage):
+                    result = message_text(msg.content).replace("\n", " ")
+                    print(f"  [{label}] <- {msg.name}: {result[:300]}", flush=True)
+    print()
+    return last
+
+
+def agent_config(thread_id: Optional[str] = None) -> dict:
+    """Run config; graphs with a checkpointer keep each thread_id's history separately."""
+    config = {"recursion_limit": 50}
+    if thread_id is not None:
+        config["configurable"] = {"thread_id": thread_id}
+    return config
+
+
+async def run_stage(agent, query, config, label, transcript, timeout, resume=False, echo_tokens=True):
+    """
+    Run one agent on its checkpoint thread and return its last message. With
+    resume, a run that was cut off continues where it stopped (no LLM or tool
+    call is repeated) and a finished one just returns its answer.
+    """
+    if resume and getattr(agent, "checkpointer", None) is not None:
+        state = await agent.aget_state(config)
+        messages = state.values.get("messages") if state.values else None
+        if messages and not state.next:
+            print(f"\n[{label}] already finished")
+            return messages[-1]
+        if messages:
+            query = None
+    return await asyncio.wait_for(
+        stream_agent(agent, query, config, label, transcript, echo_tokens=echo_tokens), timeout=timeout
+    )
+
+
+async def run_handoff(query, agent_prd, agent_imp, transcript, thread_id: Optional[str] = None,
+                      resume: bool = False, echo_tokens: bool = True):
+    """Planner, then implementer on the planner's answer. Returns the implementer's last message."""
+    prefix = f"{thread_id}/" if thread_id and not echo_tokens else ""
+    last = await run_stage(agent_prd, query, agent_config(thread_id and f"{thread_id}-planner"),
+                           f"{prefix}planner", transcript, timeout=100,   # <- max seconds before stop
+                           resume=resume, echo_tokens=echo_tokens)
+    handoffresponse = message_text(getattr(last, "content", ""))
+    return await run_stage(agent_imp, handoffresponse, agent_config(thread_id and f"{thread_id}-implementer"),
+                           f"{prefix}implementer", transcript, timeout=300,   # <- max seconds before stop
+                           resume=resume, echo_tokens=echo_tokens)
+
+
+async def run_pipelined_query(query, agent_prd, agent_imp, transcript, parallel: int,
+                              thread_id: Optional[str] = None, echo_tokens: bool = True) -> str:
+    """Planner and implementer overlapped: each task starts as soon as it is planned and unblocked."""
+    prefix = f"{thread_id}/" if thread_id else ""
+
+    async def plan(on_text):
+        return await stream_agent(agent_prd, query + PLAN_FORMAT, agent_config(thread_id and f"{thread_id}-planner"),
+                                  f"{prefix}planner", transcript, on_token=on_text, echo_tokens=echo_tokens)
+
+    async def implement(task, prompt):
+        print(f"\n[{prefix}task {task.id}] started: {task.title}")
+        last = await stream_agent(agent_imp, prompt, agent_config(thread_id and f"{thread_id}-task{task.id}"),
+                                  f"{prefix}task {task.id}", transcript, echo_tokens=echo_tokens and parallel == 1)
+        print(f"\n[{prefix}task {task.id}] finished")
+        return last
+
+    tasks = await run_pipelined(query, plan, implement, parallel,
+                                fallback=lambda last: message_text(getattr(last, "content", "")))
+    summary = ", ".join(f"{t.id}:{t.status}" for t in sorted(tasks.values(), key=lambda t: t.id))
+    print(f"\n{prefix}Tasks: {summary}")
+    return summary
+
+
+async def connect_session(stack: AsyncExitStack, retries: int = 5, session_name: Optional[str] = None,
+                          workspace: Optional[str] = None) -> ClientSession:
+    """
+    Open and initialize an MCP session, either over stdio (spawning the server)
+    or to a running daemon. Connecting to a daemon is retried with backoff so
+    the agent can reconnect while the server is (re)starting. session_name
+    picks a named workspace session on the daemon; workspace sets the root
+    directory of a spawned server.
+    """
+    headers = {SESSION_HEADER: session_name} if session_name else None
+    if server_url is None:
+        params = server_params
+        if workspace is not None:
+            params = StdioServerParameters(command=server_params.command, args=server_params.args,
+                                           env={**os.environ, "MCP_WORKSPACE": workspace})
+        read, write = await stack.enter_async_context(stdio_client(params))
+        session = await stack.enter_async_context(ClientSession(read, write))
+        await session.initialize()
+        return session
+
+    delay = 0.5
+    for attempt in range(retries):
+        attempt_stack = AsyncExitStack()
+        try:
+            read, write, _ = await attempt_stack.enter_async_context(streamablehttp_client(server_url, headers=headers))
+            session = await attempt_stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            await stack.enter_async_context(attempt_stack.pop_all())
+            return session
+        except Exception as e:
+            await attempt_stack.aclose()
+            if attempt == retries - 1:
+                raise ConnectionError(f"Could not connect to MCP server at {server_url}: {e}") from e
+            print(f"MCP server at {server_url} not reachable, retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+def configure_llm(stack: AsyncExitStack, args) -> None:
+    """Attach metrics and the response cache to the shared llm; undone when stack closes."""
+    metrics = Metrics()
+    llm.callbacks = [LLMMetrics(metrics)]
+    stack.callback(lambda: print(f"LLM calls: {json.dumps(metrics.snapshot().get('llm', {}))}"))
+    if args.metrics_file:
+        stack.callback(MetricsDumper(metrics, args.metrics_file, args.metrics_interval, prefix="agent").start().stop)
+    if args.llm_cache:
+        llm.cache = LLMCache(args.llm_cache, mode=args.cache_mode)
+        stack.callback(lambda: print(f"LLM cache: {llm.cache.stats()}"))
+        stack.callback(llm.cache.close)
+
+
+async def build_agents(session, args, checkpointer=None):
+    """
+    Planner and implementer graphs over the tools of one MCP session. With
+    --pipeline they run at the same time on that session, so they get no
+    tool that changes its cwd (see pipeline.CWD_TOOLS).
+    """
+    tools=await load_mcp_tools(session)
+    if args.pipeline:
+        tools = [t for t in tools if t.name not in CWD_TOOLS]
+    context = None
+    if args.max_context_tokens > 0:
+        context = ContextManager(llm, max_tokens=args.max_context_tokens, max_tool_chars=args.max_tool_chars)
+        tools = tools + [context.recall_tool]
+    agent_prd=build_react_agent(llm,tools,prompt=agent1,max_concurrency=args.tool_concurrency,
+                                checkpointer=checkpointer,context=context)
+    agent_imp=build_react_agent(llm,tools,prompt=agent2,max_concurrency=args.tool_concurrency,
+                                checkpointer=checkpointer,context=context)
+    return agent_prd, agent_imp
+
+
+def read_jobs(path: str) -> List[dict]:
+    """Batch jobs, one per line: plain query text or a JSON object with "query" (and optionally "id")."""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    jobs = []
+    with f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError:
+                job = line
+            if not isinstance(job, dict):
+                job = {"query": str(job)}
+            job["id"] = str(job.get("id") or f"job{n}")
+            jobs.append(job)
+    return jobs
+
+
+async def run_job(job: dict, args, transcript: TranscriptWriter) -> dict:
+    """One batch job in its own workspace/session and checkpointer threads; never raises."""
+    job_id = re.sub(r"[^A-Za-z0-9_.-]", "_", job["id"])[:64]
+    thread_id = f"{args.thread}-{job_id}"
+    workspace = None
+    if server_url is None:
+        workspace = os.path.join(args.jobs_dir, job_id)
+        os.makedirs(workspace, exist_ok=True)
+    record = {"id": job["id"], "query": job["query"], "thread": thread_id, "workspace": workspace}
+    start = time.perf_counter()
+    try:
+        async with AsyncExitStack() as stack:
+            session = await connect_session(stack, session_name=f"job-{job_id}", workspace=workspace)
+            agent_prd, agent_imp = await build_agents(session, args, checkpointer)
+            if args.pipeline:
+                answer = await asyncio.wait_for(
+                    run_pipelined_query(job["query"], agent_prd, agent_imp, transcript, args.parallel,
+                                        thread_id=thread_id, echo_tokens=False),
+                    timeout=400,
+                )
+            else:
+                # Jobs of a rerun batch (same --thread) pick up where they stopped
+                last = await run_handoff(job["query"], agent_prd, agent_imp, transcript, thread_id,
+                                         resume=True, echo_tokens=False)
+                answer = message_text(getattr(last, "content", ""))
+        record.update(status="done", answer=answer)
+    except asyncio.TimeoutError:
+        record.update(status="timeout", error="job took too long and was stopped")
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return record
+
+
+async def run_batch(args):
+    """Run every job from --batch with --workers at a time, writing each result as soon as it finishes."""
+    jobs = read_jobs(args.batch)
+    async with AsyncExitStack() as stack:
+        transcript = TranscriptWriter(args.transcript)
+        stack.callback(transcript.close)
+        configure_llm(stack, args)
+        out = sys.stdout if args.batch_output == "-" else open(args.batch_output, "a", encoding="utf-8")
+        if out is not sys.stdout:
+            stack.callback(out.close)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        statuses: Dict[str, int] = {}
+
+        async def worker():
+            while not queue.empty():
+                record = await run_job(queue.get_nowait(), args, transcript)
+                statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+                print(f"\n[{record['id']}] {record['status']} in {record['elapsed_s']}s", flush=True)
+
+        print(f"Running {len(jobs)} job(s) with {min(args.workers, len(jobs))} worker(s)")
+        await asyncio.gather(*(worker() for _ in range(max(1, min(args.workers, len(jobs))))))
+        print(f"\nBatch finished: {statuses}")
+
+
+def make_checkpointer(args) -> None:
+    global checkpointer
+    if args.checkpoint_db:
+        checkpointer = SQLiteSaver(args.checkpoint_db)
+    args.thread = args.thread or uuid.uuid4().hex[:8]
+
+
+async def thread_used(thread_id: str) -> bool:
+    """Whether a query on this thread id (its planner thread) is already in the checkpointer."""
+    return await checkpointer.aget_tuple(agent_config(f"{thread_id}-planner")) is not None
+
+
+async def next_utterance(timeout: float) -> str:
+    """Listen until something is actually said; the microphone runs off the event loop."""
+    # voice pulls in sounddevice/groq, so only import it when asked for
+    from voice import alisten
+    while True:
+        text = (await alisten(timeout=timeout, verbose=False)).strip()
+        if text:
+            return text
+
+
+async def run_agent(args):
     
     global mcp_client
-    async with stdio_client(server_params) as (read,write):
-        async with ClientSession(read,write) as session:
-            await session.initialize()
-            
-            mcp_client = type("MCPClientHolder",(),{"session":session})
-            tools=await load_mcp_tools(session)
-            agent_prd=create_react_agent(llm,tools,prompt=agent1)
-            agent_imp=create_react_agent(llm,tools,prompt=agent2)
-            print("mcp started type quit to exit")
-            
-            while True:
-                query = input("\nQuery (or type 'voice'): ").strip()
+    async with AsyncExitStack() as stack:
+        session = await connect_session(stack, session_name=args.session)
+        transcript = TranscriptWriter(args.transcript)
+        stack.callback(transcript.close)
+        
+        mcp_client = type("MCPClientHolder",(),{"session":session})
+        configure_llm(stack, args)
+        agent_prd, agent_imp = await build_agents(session, args, checkpointer)
+        print(f"mcp started type quit to exit (checkpoint threads: {args.thread}-q<n>)")
 
+        count = 0
+        interrupted = args.resume   # thread id of the last query that timed out
+        pending = "resume" if args.resume else None
+        next_voice: Optional[asyncio.Task] = None   # the next spoken query, captured while the agent works
+        stack.callback(lambda: next_voice and next_voice.cancel())
+        
+        while True:
+            if pending:
+                query, pending = pending, None
+            elif args.voice:
+                if next_voice is None:
+                    print("\n🎤 Speak your query" + (" (or say 'resume')" if interrupted else "") + "...")
+                    next_voice = asyncio.create_task(next_utterance(args.voice_timeout))
+                try:
+                    query = await next_voice
+                except asyncio.TimeoutError:
+                    print("\nNo query heard.")
+                    continue
+                finally:
+                    next_voice = None
+                print(f"\n🎤 {query}")
+            else:
+                # input() in a thread, so the MCP session stays serviced while we wait
+                query = (await asyncio.to_thread(
+                    input, "\nQuery (or type 'voice'" + (", 'resume'" if interrupted else "") + "): ")).strip()
                 if query.lower() == "voice":
-                    audio_file = record_audio(duration=7)
-                    query = transcribe(audio_file).strip()
+                    from voice import alisten
+                    try:
+                        query = (await alisten(timeout=args.voice_timeout)).strip()   # stops when you stop talking
+                    except asyncio.TimeoutError:
+                        print("\nNo query heard.")
+                        continue
+            if not query:
+                continue   # nothing typed, or the lead-in ran out before anyone spoke
+
+            command = query.lower().strip(" .!")   # transcripts come back as "Quit."
+            if command in ["quit", "exit", "stop"]:
+                break
+            if args.voice:
+                # Start on the next utterance now so it overlaps with this query
+                next_voice = asyncio.create_task(next_utterance(args.voice_timeout))
+
+            if command == "resume" and interrupted:
+                thread_id, resume = interrupted, True
+            else:
+                count += 1
+                # With an explicit --thread, an earlier run may already have used <thread>-q<n>;
+                # starting there would append this query to that run's history
+                while await thread_used(f"{args.thread}-q{count}"):
+                    count += 1
+                thread_id, resume = f"{args.thread}-q{count}", False
+            try:
+                if resume or (not args.pipeline and not args.no_stream):
+                    await run_handoff(query, agent_prd, agent_imp, transcript, thread_id, resume=resume)
+                    interrupted = None
+                    continue
+
+                if args.pipeline:
+                    await asyncio.wait_for(
+                        run_pipelined_query(query, agent_prd, agent_imp, transcript, args.parallel, thread_id=thread_id),
+                        timeout=400   # <- planner + implementer budget, now overlapping
+                    )
+                    continue
 
-                if query.lower() in ["quit", "exit", "stop"]:
-                    break
-                 
-                
                 response1 = await asyncio.wait_for(
-                    agent_prd.ainvoke({"messages":query},{"recursion_limit": 50}),
+                    agent_prd.ainvoke({"messages":query},agent_config(f"{thread_id}-planner")),
                     timeout=100   # <- max seconds before stop
                 )
-                
+
                 handoffresponse = get_last_message(response1)
 
-        # asyncio.wait_for ensures a hard timeout
+            # asyncio.wait_for ensures a hard timeout
                 response = await asyncio.wait_for(
-                    agent_imp.ainvoke({"messages":handoffresponse},{"recursion_limit": 50}),
+                    agent_imp.ainvoke({"messages":handoffresponse},agent_config(f"{thread_id}-implementer")),
                     timeout=300   # <- max seconds before stop
                 )
-                 
-                  
-                try:
-                    formatted = json.dumps(response, indent=2, cls=CustomEncoder)
+            except asyncio.TimeoutError:
+                if args.pipeline and not resume:
+                    # Pipelined tasks run on their own threads, which 'resume' (planner -> implementer) doesn't know
+                    print(f"\nTimed out. Pipelined queries can't be resumed; thread {thread_id} is kept in the checkpoints.")
+                    continue
+                interrupted = thread_id
+                print(f"\nTimed out. Type 'resume' to continue thread {thread_id} from its last completed step.")
+                continue
+             
+              
+            try:
+                formatted = json.dumps(response, indent=2, cls=CustomEncoder)
 
-                    # Add numbering to main JSON objects if it's a dict with "messages"
-                    try:
-                        data = json.loads(formatted)
-                        if isinstance(data, dict) and "messages" in data:
-                            for i, msg in enumerate(data["messages"], start=1):
-                                msg["_index"] = i  # add numbering inside each message
-                            formatted = json.dumps(data, indent=2, cls=CustomEncoder)
-                    except Exception:
-                        pass
+                # Add numbering to main JSON objects if it's a dict with "messages"
+                try:
+                    data = json.loads(formatted)
+                    if isinstance(data, dict) and "messages" in data:
+                        for i, msg in enumerate(data["messages"], start=1):
+                            msg["_index"] = i  # add numbering inside each message
+                        formatted = json.dumps(data, indent=2, cls=CustomEncoder)
+                except Exception:
+                    pass
 
-                except Exception as e:
-                    formatted = str(response)
-                                
-                print("\n Response:")
-                print(formatted)
-            return
+            except Exception as e:
+                formatted = str(response)
+                            
+            print("\n Response:")
+            print(formatted)
+        return
 
 
 
 if __name__== "__main__":
-    asyncio.run(run_agent())           
\ No newline at end of file
+    args = parse_args()
+    configure(args.server)
+    make_checkpointer(args)
+    asyncio.run(run_batch(args) if args.batch else run_agent(args))           
\ No newline at end of file
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Annotated, Dict, List, Optional, Sequence, TypedDict
+
+from langchain_core.messages import AIMessage, AnyMessage, SystemMessage, ToolMessage
+from langchain_core.tools import BaseTool
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from langgraph.managed import RemainingSteps
+
+# Tools that only read state, so calls to them from one model turn can run
+# at the same time. Everything else (write_file, the edit tools,
+# change_directory, commands, ...) runs alone and in the order requested.
+READ_ONLY_TOOLS = {
+    "read_file",
+    "read_files",
+    "list_files",
+    "search_workspace",
+    "web_search",
+    "current_working_directory",
+    "os_name",
+    "check_process_logs",
+    "list_processes",
+    "recall_tool_output",
+    "diff_snapshot",
+}
+
+
+# Final answer when the recursion_limit runs out mid tool loop (same as create_react_agent)
+OUT_OF_STEPS = "Sorry, need more steps to process this request."
+
+
+class AgentState(TypedDict):
+    messages: Annotated[List[AnyMessage], add_messages]
+    remaining_steps: RemainingSteps
+
+
+class ParallelToolNode:
+    """
+    Executes the tool calls of the last AI message.
+
+    Runs of consecutive read-only calls are dispatched concurrently (at most
+    max_concurrency in flight over the MCP session); a call to any other tool
+    waits for everything before it and finishes before anything after it
+    starts. ToolMessages are returned in the order the calls were made.
+    """
+
+    def __init__(self, tools: Sequence[BaseTool], max_concurrency: int = 4, read_only=READ_ONLY_TOOLS):
+        self.tools_by_name: Dict[str, BaseTool] = {t.name: t for t in tools}
+        self.read_only = set(read_only)
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _run(self, call: dict, config) -> ToolMessage:
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return ToolMessage(
+                content=f"Error: {call['name']} is not a valid tool, try one of [{', '.join(self.tools_by_name)}].",
+                tool_call_id=call["id"], name=call["name"], status="error",
+            )
+        async with self.semaphore:
+            try:
+                result = await tool.ainvoke({**call, "type": "tool_call"}, config)
+            except Exception as e:
+                return ToolMessage(
+                    content=f"Error: {e!r}\n Please fix your mistakes.",
+                    tool_call_id=call["id"], name=call["name"], status="error",
+                )
+        if isinstance(result, ToolMessage):
+            return result
+        return ToolMessage(content=str(result), tool_call_id=call["id"], name=call["name"])
+
+    async def __call__(self, state: AgentState, config) -> dict:
+        calls = state["messages"][-1].tool_calls
+        results: List[Optional[ToolMessage]] = [None] * len(calls)
+        i = 0
+        while i < len(calls):
+            j = i
+            while j < len(calls) and calls[j]["name"] in self.read_only:
+                j += 1
+            if j == i:
+                results[i] = await self._run(calls[i], config)
+                i += 1
+                continue
+            batch = await asyncio.gather(*(self._run(calls[k], config) for k in range(i, j)))
+            results[i:j] = batch
+            i = j
+        return {"messages": results}
+
+
+def build_react_agent(model, tools: Sequence[BaseTool], prompt, max_concurrency: int = 4, checkpointer=None,
+                      context=None):
+    """
+    ReAct graph (model -> tools -> model ... until no tool calls), like
+    langgraph's create_react_agent but using ParallelToolNode for tools.
+
+    If a context.ContextManager is given, the history is trimmed and
+    summarized before each model call so the prompt stays bounded.
+
+    When the recursion_limit leaves no room for another tool round, a
+    model turn that still asks for tools is replaced with OUT_OF_STEPS
+    instead of the graph raising GraphRecursionError.
+    """
+    bound = model.bind_tools(tools)
+    system = prompt if isinstance(prompt, SystemMessage) else SystemMessage(content=prompt)
+    tool_node = ParallelToolNode(tools, max_concurrency)
+
+    async def call_model(state: AgentState, config) -> dict:
+        messages, updates = state["messages"], []
+        if context is not None:
+            messages, updates = await context.prepare(messages)
+        response = await bound.ainvoke([system] + messages, config)
+        if state["remaining_steps"] < 2 and isinstance(response, AIMessage) and response.tool_calls:
+            response = AIMessage(id=response.id, content=OUT_OF_STEPS)
+        return {"messages": updates + [response]}
+
+    async def call_tools(state: AgentState, config) -> dict:
+        return await tool_node(state, config)
+
+    def route(state: AgentState):
+        last = state["messages"][-1]
+        return "tools" if isinstance(last, AIMessage) and last.tool_calls else END
+
+    graph = StateGraph(AgentState)
+    graph.add_node("agent", call_model)
+    graph.add_node("tools", call_tools)
+    graph.add_edge(START, "agent")
+    graph.add_conditional_edges("agent", route, ["tools", END])
+    graph.add_edge("tools", "agent")
+    return graph.compile(checkpointer=checkpointer)
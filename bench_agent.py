@@ -0,0 +1,362 @@
+"""
+Offline benchmark for the agent pipeline and the MCP tools.
+
+A scripted chat model stands in for Gemini, so no network access or API key
+is needed. mcp_server.py is started over stdio on a temporary workspace and
+each canned scenario runs the planner -> implementer handoff from agent.py
+through the same ReAct graphs and tool node.
+
+Reports, as JSON:
+  - per-scenario wall time, model steps and tool calls
+  - per-tool latency percentiles (client-side, including the MCP round trip)
+  - MCP round-trip overhead: ping and a no-op tool call
+  - server startup time and total wall time
+  - whether every scenario, recorded through the LLM cache, replays
+    step for step without calling the model
+  - whether a model that never stops calling tools ends with a final
+    answer when the recursion_limit runs out, instead of an exception
+
+Usage:
+    python bench_agent.py [--runs 5] [--model-latency-ms 0] [--output bench_agent.json]
+                          [--baseline previous.json] [--scenario NAME ...]
+
+With --baseline, median changes against an earlier result file are printed,
+which makes it easy to compare two commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def call(name: str, **args) -> dict:
+    return {"name": name, "args": args}
+
+
+# Each scenario is what the planner and the implementer "say", turn by turn:
+# a list of tool calls (run in one model turn) or a final text answer.
+SCENARIOS: Dict[str, Dict[str, list]] = {
+    "scaffold": {
+        "planner": [
+            [call("list_files", path=".")],
+            "1. Create app.py, util.py and README.md\n2. Check the result",
+        ],
+        "implementer": [
+            [call("write_file", filename="proj/app.py", content="from util import add\nprint(add(1, 2))\n")],
+            [call("write_file", filename="proj/util.py", content="def add(a, b):\n    return a + b\n")],
+            [call("write_file", filename="proj/README.md", content="# proj\n" + "notes\n" * 200)],
+            [call("list_files", path="proj", recursive=True)],
+            "Project scaffolded.",
+        ],
+    },
+    "edit_and_run": {
+        "planner": [
+            "Write a script, fix it with a small edit and run it.",
+        ],
+        "implementer": [
+            [call("write_file", filename="run/hello.py", content="print('hello')\nprint(sum(range(10)))\n")],
+            [call("edit_file", filename="run/hello.py",
+                  edits=[{"op": "update", "row": 0, "content": "print('hello, bench')"}])],
+            [call("run_python", filename="run/hello.py", mode="exec")],
+            [call("run_command", command="ls run")],
+            "Script runs.",
+        ],
+    },
+    "explore": {
+        "planner": [
+            [call("search_workspace", query="def add"), call("list_files", path=".", recursive=True)],
+            [call("read_file", filename="proj/util.py"), call("read_file", filename="proj/README.md"),
+             call("current_working_directory")],
+            "The project has a util module with add().",
+        ],
+        "implementer": [
+            [call("read_file", filename="proj/app.py", start_line=1, end_line=2)],
+            "Nothing to change.",
+        ],
+    },
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Replays a fixed list of turns instead of calling an LLM."""
+
+    script: List[Any]
+    latency: float = 0.0
+    step: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _next(self) -> AIMessage:
+        turn = self.script[min(self.step, len(self.script) - 1)]
+        self.step += 1
+        if isinstance(turn, str):
+            return AIMessage(content=turn)
+        calls = [{"name": c["name"], "args": c["args"], "id": f"call_{uuid.uuid4().hex[:8]}"} for c in turn]
+        return AIMessage(content="", tool_calls=calls)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next())])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next())])
+
+
+class Timings(AsyncCallbackHandler):
+    """Collects tool latencies and model/tool call counts from graph callbacks."""
+
+    def __init__(self):
+        self.started: Dict[Any, tuple] = {}
+        self.tools: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.model_calls = 0
+        self.tool_calls = 0
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.model_calls += 1
+
+    async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.tool_calls += 1
+        self.started[run_id] = ((serialized or {}).get("name") or kwargs.get("name", "?"), time.perf_counter())
+
+    async def on_tool_end(self, output, *, run_id, **kwargs):
+        name, start = self.started.pop(run_id, ("?", time.perf_counter()))
+        self.tools[name].append((time.perf_counter() - start) * 1000)
+
+    async def on_tool_error(self, error, *, run_id, **kwargs):
+        name, _ = self.started.pop(run_id, ("?", 0))
+        self.errors[name] += 1
+
+
+def percentiles(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 2),
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+async def run_scenario(name: str, scenario: dict, tools, timings: Timings, latency: float, cache=None) -> dict:
+    from agent_graph import build_react_agent
+
+    planner = build_react_agent(ScriptedChatModel(script=scenario["planner"], latency=latency, cache=cache), tools,
+                                prompt="You plan coding tasks.")
+    implementer = build_react_agent(ScriptedChatModel(script=scenario["implementer"], latency=latency, cache=cache),
+                                    tools, prompt="You implement coding tasks.")
+    config = {"recursion_limit": 50, "callbacks": [timings]}
+    model_calls, tool_calls = timings.model_calls, timings.tool_calls
+
+    start = time.perf_counter()
+    plan = await planner.ainvoke({"messages": f"[{name}] benchmark request"}, config)
+    handoff = plan["messages"][-1].content
+    await implementer.ainvoke({"messages": handoff}, config)
+    return {
+        "wall_ms": (time.perf_counter() - start) * 1000,
+        "model_steps": timings.model_calls - model_calls,
+        "tool_calls": timings.tool_calls - tool_calls,
+    }
+
+
+async def roundtrip(session, runs: int) -> dict:
+    ping, noop = [], []
+    for _ in range(max(runs, 20)):
+        start = time.perf_counter()
+        await session.send_ping()
+        ping.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        await session.call_tool("os_name", {})
+        noop.append((time.perf_counter() - start) * 1000)
+    return {"ping": percentiles(ping), "noop_tool": percentiles(noop)}
+
+
+async def cache_check(scenarios: Dict[str, dict], tools) -> dict:
+    """
+    Record every scenario (all its model steps, tool calls in between) with
+    LLMCache, then replay it in replay mode, where any miss raises CacheMiss.
+    """
+    from llm_cache import CacheMiss, LLMCache
+
+    results = {}
+    # Outside the workspace, so the scenarios' tool output is the same both times
+    cache_dir = tempfile.mkdtemp(prefix="mcp-bench-cache-")
+    for name, scenario in scenarios.items():
+        path = os.path.join(cache_dir, f"{name}.sqlite")
+        recorder = LLMCache(path, mode="record")
+        replayer = LLMCache(path, mode="replay")
+        try:
+            await run_scenario(name, scenario, tools, Timings(), 0, cache=recorder)
+            try:
+                await run_scenario(name, scenario, tools, Timings(), 0, cache=replayer)
+                error = None
+            except CacheMiss as e:
+                error = str(e)
+            results[name] = {"recorded": recorder.misses, "replayed": replayer.hits,
+                             "ok": error is None and replayer.hits == recorder.misses, "error": error}
+        finally:
+            recorder.close()
+            replayer.close()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+async def step_limit_check(tools, recursion_limit: int = 10) -> dict:
+    """Drive a model that asks for a tool on every turn past the recursion_limit."""
+    from agent_graph import OUT_OF_STEPS, build_react_agent
+
+    model = ScriptedChatModel(script=[[call("list_files", path=".")]])
+    agent = build_react_agent(model, tools, "You are a benchmark agent.")
+    try:
+        result = await agent.ainvoke({"messages": [("user", "loop forever")]},
+                                     {"recursion_limit": recursion_limit})
+    except Exception as e:
+        return {"ok": False, "model_steps": model.step, "error": f"{type(e).__name__}: {e}"}
+    last = result["messages"][-1]
+    return {"ok": last.content == OUT_OF_STEPS and not last.tool_calls, "model_steps": model.step, "error": None}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def benchmark(args) -> dict:
+    from langchain_mcp_adapters.tools import load_mcp_tools
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    workspace = tempfile.mkdtemp(prefix="mcp-bench-")
+    env = {**os.environ, "MCP_WORKSPACE": workspace}
+    params = StdioServerParameters(command=sys.executable, args=[os.path.join(HERE, "mcp_server.py")],
+                                   cwd=HERE, env=env)
+    scenarios = {k: v for k, v in SCENARIOS.items() if not args.scenario or k in args.scenario}
+    timings = Timings()
+    runs: Dict[str, List[dict]] = defaultdict(list)
+
+    total = time.perf_counter()
+    try:
+        start = time.perf_counter()
+        async with stdio_client(params, errlog=open(os.devnull, "w")) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                tools = await load_mcp_tools(session)
+                server_start = (time.perf_counter() - start) * 1000
+
+                for _ in range(args.runs):
+                    for name, scenario in scenarios.items():
+                        runs[name].append(await run_scenario(name, scenario, tools, timings,
+                                                             args.model_latency_ms / 1000))
+                mcp_overhead = await roundtrip(session, args.runs)
+                replay = await cache_check(scenarios, tools)
+                step_limit = await step_limit_check(tools)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "runs": args.runs,
+        "model_latency_ms": args.model_latency_ms,
+        "server_start_ms": round(server_start, 1),
+        "total_wall_ms": round((time.perf_counter() - total) * 1000, 1),
+        "scenarios": {
+            name: {
+                "wall_ms": percentiles([r["wall_ms"] for r in results]),
+                "model_steps": results[0]["model_steps"],
+                "tool_calls": results[0]["tool_calls"],
+            }
+            for name, results in runs.items()
+        },
+        "tools": {name: percentiles(samples) for name, samples in sorted(timings.tools.items())},
+        "tool_errors": dict(timings.errors),
+        "mcp_roundtrip": mcp_overhead,
+        "llm_cache_replay": replay,
+        "step_limit": step_limit,
+    }
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """Median changes for scenarios, tools and round trips present in both results."""
+    lines = []
+
+    def diff(label, new, old):
+        if new.get("p50_ms") is None or not old.get("p50_ms"):
+            return
+        change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        lines.append(f"{label}: {old['p50_ms']} -> {new['p50_ms']} ms ({change:+.1f}%)")
+
+    for name, r in results["scenarios"].items():
+        if name in baseline.get("scenarios", {}):
+            diff(f"scenario {name}", r["wall_ms"], baseline["scenarios"][name]["wall_ms"])
+    for name, r in results["tools"].items():
+        if name in baseline.get("tools", {}):
+            diff(f"tool {name}", r, baseline["tools"][name])
+    for name, r in results["mcp_roundtrip"].items():
+        if name in baseline.get("mcp_roundtrip", {}):
+            diff(f"mcp {name}", r, baseline["mcp_roundtrip"][name])
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="times each scenario is run")
+    parser.add_argument("--model-latency-ms", type=float, default=0,
+                        help="simulated latency of every model call (0 measures pure pipeline overhead)")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="only run these scenarios (repeatable)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier --output file to compare medians against")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline} (commit {baseline.get('commit')}):", file=sys.stderr)
+        for line in compare(results, baseline):
+            print("  " + line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Startup-time benchmark for the MCP server and the agent's voice module.
+
+Measures, over several fresh interpreters:
+  - import time of mcp_server and voice
+  - time from spawning mcp_server.py over stdio to the first tools/list reply
+
+Usage:
+    python bench_startup.py [--runs 5] [--output bench_output.txt]
+                            [--max-server-import-ms 1200] [--max-voice-import-ms 150]
+                            [--max-list-ms 2000]
+
+Exits with status 1 if a median goes over its limit, so it can guard
+against startup regressions (e.g. a heavy import creeping back to module level).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def import_ms(module: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        cwd=HERE, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+async def first_tool_list_ms() -> float:
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    params = StdioServerParameters(command=sys.executable, args=[os.path.join(HERE, "mcp_server.py")], cwd=HERE)
+    start = time.perf_counter()
+    async with stdio_client(params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            await session.list_tools()
+            return (time.perf_counter() - start) * 1000
+
+
+def summarize(samples):
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "max_ms": round(max(samples), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    # Most of the server's import time is the mcp package itself
+    parser.add_argument("--max-server-import-ms", type=float, default=1200)
+    parser.add_argument("--max-voice-import-ms", type=float, default=150)
+    parser.add_argument("--max-list-ms", type=float, default=2000)
+    args = parser.parse_args()
+
+    results = {}
+    for module in ("mcp_server", "voice"):
+        results[f"import_{module}"] = summarize([import_ms(module) for _ in range(args.runs)])
+    results["first_tool_list"] = summarize(
+        [asyncio.run(first_tool_list_ms()) for _ in range(args.runs)]
+    )
+
+    limits = {
+        "import_mcp_server": args.max_server_import_ms,
+        "import_voice": args.max_voice_import_ms,
+        "first_tool_list": args.max_list_ms,
+    }
+    failures = [
+        f"{key}: {results[key]['median_ms']} ms > {limit} ms"
+        for key, limit in limits.items()
+        if results[key]["median_ms"] > limit
+    ]
+    results["failures"] = failures
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import atexit
+import queue
+import sqlite3
+import threading
+from typing import Any, List, Optional, Sequence, Set
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT,
+    type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, parent_id TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT, checkpoint_ns TEXT, channel TEXT, version TEXT, type TEXT, value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,
+    channel TEXT, type TEXT, value BLOB, task_path TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class SQLiteSaver(InMemorySaver):
+    """
+    Checkpointer that keeps LangGraph checkpoints in a SQLite file so a run
+    can be resumed after a timeout or a crash.
+
+    Reads are served from memory; a thread's checkpoints are loaded from the
+    file the first time it is read or written, so start-up doesn't depend
+    on how much history the file holds. Writes update memory right away and are queued for a background thread
+    that commits them in batches every `flush_interval` seconds, so saving
+    a checkpoint adds no disk I/O to an agent step. At most the last
+    `flush_interval` seconds of steps are lost if the process dies.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db_lock = threading.Lock()
+        self.loaded: Set[str] = set()
+        self.pending: "queue.Queue[tuple]" = queue.Queue()
+        self.closed = threading.Event()
+        self.closed_db = False
+        self.thread = threading.Thread(target=self._writer, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _load(self, thread_id: str) -> None:
+        if thread_id in self.loaded:
+            return
+        with self.db_lock:
+            if thread_id in self.loaded:
+                return
+            for ns, checkpoint_id, type_, checkpoint, meta_type, meta, parent in self.db.execute(
+                "SELECT checkpoint_ns, checkpoint_id, type, checkpoint, metadata_type, metadata, parent_id "
+                "FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            ):
+                self.storage[thread_id][ns][checkpoint_id] = ((type_, checkpoint), (meta_type, meta), parent)
+            for ns, channel, version, type_, value in self.db.execute(
+                "SELECT checkpoint_ns, channel, version, type, value FROM blobs WHERE thread_id = ?", (thread_id,)
+            ):
+                self.blobs[(thread_id, ns, channel, version)] = (type_, value)
+            for ns, checkpoint_id, task_id, idx, channel, type_, value, task_path in self.db.execute(
+                "SELECT checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path "
+                "FROM writes WHERE thread_id = ?", (thread_id,)
+            ):
+                self.writes[(thread_id, ns, checkpoint_id)][(task_id, idx)] = (task_id, channel, (type_, value), task_path)
+            self.loaded.add(thread_id)
+
+    def _load_config(self, config: Optional[dict]) -> None:
+        if config is not None:
+            self._load(config["configurable"]["thread_id"])
+            return
+        # Listing every thread needs all of them
+        with self.db_lock:
+            thread_ids = [row[0] for row in self.db.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+        for thread_id in thread_ids:
+            self._load(thread_id)
+
+    # -- reads: load the thread first --
+
+    def get_tuple(self, config):
+        self._load_config(config)
+        return super().get_tuple(config)
+
+    def list(self, config, **kwargs):
+        self._load_config(config)
+        return super().list(config, **kwargs)
+
+    def get_delta_channel_history(self, *, config, channels):
+        self._load_config(config)
+        return super().get_delta_channel_history(config=config, channels=channels)
+
+    # -- writes: update memory through InMemorySaver, then queue the same rows --
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self._load_config(config)
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"]["checkpoint_ns"]
+        (type_, data), (meta_type, meta), parent = self.storage[thread_id][ns][checkpoint["id"]]
+        rows: List[tuple] = [(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (thread_id, ns, checkpoint["id"], type_, data, meta_type, meta, parent),
+        )]
+        for channel, version in new_versions.items():
+            blob_type, blob = self.blobs[(thread_id, ns, channel, version)]
+            rows.append((
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, channel, str(version), blob_type, blob),
+            ))
+        self.pending.put(rows)
+        return result
+
+    def put_writes(self, config, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        self._load_config(config)
+        super().put_writes(config, writes, task_id, task_path)
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, checkpoint_id, task, idx, channel, value[0], value[1], path),
+            )
+            for (task, idx), (_, channel, value, path) in self.writes[(thread_id, ns, checkpoint_id)].items()
+            if task == task_id
+        ]
+        self.pending.put(rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        self.loaded.add(thread_id)   # nothing left to load once the delete is flushed
+        self.pending.put([(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                          for table in ("checkpoints", "blobs", "writes")])
+
+    # -- background writer --
+
+    def _writer(self) -> None:
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Commit everything queued so far in one transaction; returns the number of rows."""
+        with self.db_lock:
+            batch = []
+            while True:
+                try:
+                    batch.extend(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            if batch and not self.closed_db:
+                with self.db:
+                    for sql, params in batch:
+                        self.db.execute(sql, params)
+            return len(batch)
+
+    def close(self) -> None:
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.thread.join()
+        self.flush()
+        with self.db_lock:
+            self.closed_db = True
+            self.db.close()
@@ -0,0 +1,200 @@
+import re
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.tools import StructuredTool
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a coding agent and its tools so the agent can continue "
+    "the task without it. Keep every decision, file path, command, error and result that still matters; "
+    "drop raw file contents and long outputs. Be concise."
+)
+
+# Don't forward these model-internal summary calls to the token stream
+NOSTREAM = {"tags": ["nostream"]}
+
+TRUNCATED = re.compile(r"\[truncated tool output, ref=(out-[0-9a-f]+)[^\]\n]*\]\n")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) that needs no API call."""
+    return len(text) // 4 + 1
+
+
+def _text(message: AnyMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = " ".join(p if isinstance(p, str) else str(p.get("text", "")) for p in content)
+    extra = ""
+    if isinstance(message, AIMessage) and message.tool_calls:
+        extra = " " + " ".join(f"{c['name']}({c['args']})" for c in message.tool_calls)
+    return str(content) + extra
+
+
+class ContextManager:
+    """
+    Keeps the prompt sent on every agent step bounded.
+
+    Before each model call, prepare():
+      - truncates oversized ToolMessages (the newest ones at max_tool_chars,
+        older ones at old_tool_chars, which also shrinks outputs truncated
+        earlier at the larger limit), keeping the head and tail and a
+        reference the agent can pass to recall_tool_output for the rest;
+      - once the estimated prompt exceeds max_tokens, replaces everything
+        between the original request and the last keep_recent messages with
+        a model-written summary (earlier summaries are folded into new ones).
+
+    The changes are returned as state updates, so the graph's stored history
+    shrinks too instead of only the copy sent to the model.
+
+    Full outputs are kept for recall up to max_stored_chars in total; past
+    that the least recently used ones are dropped, and recalling them says
+    they expired.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        max_tokens: int = 24000,
+        keep_recent: int = 8,
+        max_tool_chars: int = 16000,
+        old_tool_chars: int = 2000,
+        max_stored_chars: int = 4_000_000,
+    ):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.max_tool_chars = max_tool_chars
+        self.old_tool_chars = old_tool_chars
+        self.max_stored_chars = max_stored_chars
+        self.store: "OrderedDict[str, str]" = OrderedDict()
+        self.stored_chars = 0
+        self.expired: "OrderedDict[str, None]" = OrderedDict()   # recently evicted refs, for recall's message
+        self.stats = {"model_calls": 0, "prompt_tokens": 0, "max_prompt_tokens": 0,
+                      "truncated": 0, "summaries": 0}
+        self.recall_tool = StructuredTool.from_function(
+            self.recall,
+            name="recall_tool_output",
+            description=(
+                "Read part of a tool output that was shortened to save context. "
+                "Pass the ref from the '[... omitted ...]' note and a character offset."
+            ),
+        )
+
+    def recall(self, ref: str, offset: int = 0, length: int = 8000) -> str:
+        """Return `length` characters of a stored tool output starting at `offset`."""
+        full = self.store.get(ref)
+        if full is None:
+            if ref in self.expired:
+                return (f"Output {ref} has expired from the store; "
+                        "run the tool again if you still need it")
+            return f"No stored output with ref {ref}"
+        self.store.move_to_end(ref)
+        chunk = full[offset:offset + length]
+        end = offset + len(chunk)
+        more = f"next offset={end}" if end < len(full) else "end of output"
+        return f"[{ref}: chars {offset}-{end} of {len(full)}; {more}]\n{chunk}"
+
+    def _remember(self, text: str) -> str:
+        ref = f"out-{uuid.uuid4().hex[:8]}"
+        self.store[ref] = text
+        self.stored_chars += len(text)
+        while self.stored_chars > self.max_stored_chars and len(self.store) > 1:
+            old, old_text = self.store.popitem(last=False)
+            self.stored_chars -= len(old_text)
+            self.expired[old] = None
+            if len(self.expired) > 1000:
+                self.expired.popitem(last=False)
+        return ref
+
+    def _truncate(self, message: ToolMessage, limit: int) -> ToolMessage:
+        text = message.content if isinstance(message.content, str) else _text(message)
+        if len(text) <= limit:
+            return message
+        earlier = TRUNCATED.match(text)
+        ref: Optional[str] = None
+        if earlier is None:
+            full = text
+            ref = self._remember(text)
+        elif earlier.group(1) in self.store:
+            # Truncated before (at a larger limit): cut again from the full output
+            ref = earlier.group(1)
+            full = self.store[ref]
+        else:
+            # The full output has expired; all that's left to cut is the shortened text
+            full = text[earlier.end():]
+        head, tail = full[: limit * 3 // 4], full[-limit // 4:]
+        omitted = len(full) - len(head) - len(tail)
+        if ref is not None:
+            short = (f"[truncated tool output, ref={ref}]\n{head}\n"
+                     f"[... {omitted} chars omitted; call recall_tool_output(ref=\"{ref}\", offset={len(head)}) "
+                     f"to read them ...]\n{tail}")
+        else:
+            short = (f"[truncated tool output, ref={earlier.group(1)}, expired]\n{head}\n"
+                     f"[... {omitted} chars omitted ...]\n{tail}")
+        if earlier is not None and len(short) >= len(text) - 64:
+            return message   # already cut at this limit (or close to it)
+        self.stats["truncated"] += 1
+        return ToolMessage(content=short, tool_call_id=message.tool_call_id, name=message.name,
+                           id=message.id, status=getattr(message, "status", "success"))
+
+    def count(self, messages: List[AnyMessage]) -> int:
+        return sum(estimate_tokens(_text(m)) for m in messages)
+
+    async def prepare(self, messages: List[AnyMessage]) -> Tuple[List[AnyMessage], List[AnyMessage]]:
+        """Return (messages to send to the model, updates to apply to the graph state)."""
+        messages = list(messages)
+        updates: List[AnyMessage] = []
+
+        # Tool results after the last AI message are the ones the model is about to read.
+        last_ai = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage)), default=-1)
+        recent_start = max(len(messages) - self.keep_recent, 0)
+        for i, m in enumerate(messages):
+            if not isinstance(m, ToolMessage):
+                continue
+            limit = self.max_tool_chars if i > last_ai or i >= recent_start else self.old_tool_chars
+            short = self._truncate(m, limit)
+            if short is not m:
+                messages[i] = short
+                updates.append(short)
+
+        tokens = self.count(messages)
+        if self.model is not None and tokens > self.max_tokens:
+            messages, summary_updates = await self._summarize(messages)
+            updates += summary_updates
+            tokens = self.count(messages)
+
+        self.stats["model_calls"] += 1
+        self.stats["prompt_tokens"] += tokens
+        self.stats["max_prompt_tokens"] = max(self.stats["max_prompt_tokens"], tokens)
+        return messages, updates
+
+    async def _summarize(self, messages: List[AnyMessage]):
+        # Keep the original request (first message) and the most recent turns;
+        # never start the kept tail on a ToolMessage, which needs its AI call before it.
+        cut = max(len(messages) - self.keep_recent, 1)
+        while cut > 1 and isinstance(messages[cut], ToolMessage):
+            cut -= 1
+        old = messages[1:cut]
+        if len(old) < 2:
+            return messages, []
+
+        transcript = "\n".join(f"{type(m).__name__}: {_text(m)[:4000]}" for m in old)
+        result = await self.model.ainvoke(
+            [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=transcript)], NOSTREAM
+        )
+        summary_text = result.content if isinstance(result.content, str) else _text(result)
+        # Reuse the first removed message's id so the summary takes its place in the history.
+        summary = HumanMessage(content=f"Summary of earlier steps:\n{summary_text}", id=old[0].id)
+        self.stats["summaries"] += 1
+        updates = [summary] + [RemoveMessage(id=m.id) for m in old[1:]]
+        return [messages[0], summary] + messages[cut:], updates
@@ -0,0 +1,309 @@
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from typing import Iterable, List, Optional
+
+
+class EditError(ValueError):
+    """Raised when an edit operation is malformed."""
+
+
+def to_text(content) -> str:
+    """Agents sometimes pass JSON objects as content; store them as pretty JSON."""
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, indent=4, ensure_ascii=False, default=str)
+
+
+def as_line(text: str) -> str:
+    return text if text.endswith("\n") else text + "\n"
+
+
+class AtomicFile:
+    """
+    Text file written to a temp file next to `path` and renamed into place on
+    commit(), so readers never see a half-written file and a crash leaves the
+    old one intact. Leaving the `with` block without commit() discards it.
+    """
+
+    def __init__(self, path: str, encoding: str = "utf-8"):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        self.file = os.fdopen(fd, "w", encoding=encoding, newline="")
+        # Set when the last line written has no trailing newline yet.
+        self.pending_newline = False
+
+    def write(self, text: str) -> None:
+        self.file.write(text)
+
+    def write_line(self, line: str) -> None:
+        """Write a line, terminating the previous one first if it had no newline."""
+        if self.pending_newline:
+            self.file.write("\n")
+        self.file.write(line)
+        self.pending_newline = bool(line) and not line.endswith("\n")
+
+    def commit(self) -> None:
+        self.file.close()
+        if os.path.exists(self.path):
+            shutil.copymode(self.path, self.tmp)
+        os.replace(self.tmp, self.path)
+
+    def discard(self) -> None:
+        self.file.close()
+        try:
+            os.unlink(self.tmp)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if os.path.exists(self.tmp):
+            self.discard()
+
+
+def atomic_write(path: str, chunks: Iterable[str], encoding: str = "utf-8") -> None:
+    """Atomically replace `path` with the concatenation of `chunks`."""
+    with AtomicFile(path, encoding) as out:
+        for chunk in chunks:
+            out.write(chunk)
+        out.commit()
+
+
+def normalize_ops(ops: List[dict]) -> List[dict]:
+    """
+    Validate edit ops and expand `rows` lists into one op per row.
+
+    Each op is a dict with:
+        op: "insert", "update" or "delete"
+        row / rows: 0-based line number(s) in the file *before* the batch is applied
+        content: text for insert/update
+        substring: for update/delete, only replace/remove this text in the row(s)
+            (all rows if no row is given)
+    """
+    normalized = []
+    for i, op in enumerate(ops):
+        kind = op.get("op")
+        if kind not in ("insert", "update", "delete"):
+            raise EditError(f"op #{i}: unknown op {kind!r}")
+        if kind in ("insert", "update") and op.get("content") is None:
+            raise EditError(f"op #{i}: {kind} needs content")
+        content = to_text(op["content"]) if op.get("content") is not None else None
+        rows = op.get("rows")
+        if rows is None:
+            rows = [op.get("row")]
+        for r in rows:
+            if r is not None and (not isinstance(r, int) or r < 0):
+                raise EditError(f"op #{i}: invalid row {r!r}")
+            normalized.append({"op": kind, "row": r, "content": content,
+                               "substring": op.get("substring"), "seq": i})
+    return normalized
+
+
+def apply_edits(path: str, ops: List[dict], create: bool = False) -> int:
+    """
+    Apply a batch of insert/update/delete ops to a file in one streaming pass.
+
+    All row numbers refer to the file as it was before the batch, so callers
+    don't need to adjust later rows for earlier inserts or deletes. At each
+    row, inserts go before the original line and updates/deletes then apply
+    to it in the order given. The result is written atomically.
+
+    Returns the number of ops that changed something (0 means the file was
+    left untouched). Inserting empty content inserts nothing, as
+    insert_file_content always did.
+    """
+    ops = [op for op in normalize_ops(ops) if op["op"] != "insert" or op["content"]]
+    if not os.path.exists(path):
+        if not create:
+            raise FileNotFoundError(f"File '{path}' does not exist.")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        open(path, "w").close()
+
+    at_row = defaultdict(list)
+    every_row = []
+    whole_file = []
+    appends = []
+    for op in ops:
+        if op["row"] is not None:
+            at_row[op["row"]].append(op)
+        elif op["op"] == "insert":
+            appends.append(op)
+        elif op["substring"] is not None:
+            every_row.append(op)
+        else:
+            whole_file.append(op)
+
+    # Plain appends don't need a rewrite.
+    if appends and not (at_row or every_row or whole_file):
+        _append(path, [op["content"] for op in appends])
+        return len(appends)
+
+    # Whole-file update/delete replaces everything; only the last one matters.
+    if whole_file:
+        last = whole_file[-1]
+        text = as_line(last["content"]) if last["op"] == "update" else ""
+        atomic_write(path, [text])
+        return len(whole_file)
+
+    changed = 0
+    with AtomicFile(path) as writer, open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        n = -1
+        for n, line in enumerate(f):
+            line, hits = _edit_line(line, at_row.pop(n, ()), every_row, writer)
+            changed += hits
+            if line is not None:
+                writer.write_line(line)
+        # Inserts past the end of the file pad with blank lines, as before.
+        for r in sorted(at_row):
+            for op in at_row[r]:
+                if op["op"] != "insert":
+                    continue
+                for _ in range(r - n - 1):
+                    writer.write_line("\n")
+                n = max(n, r - 1)
+                writer.write_line(as_line(op["content"]))
+                changed += 1
+        for op in appends:
+            writer.write_line(as_line(op["content"]))
+            changed += 1
+
+        if changed:
+            writer.commit()
+    return changed
+
+
+def _edit_line(line: str, ops, every_row, writer: AtomicFile):
+    """Apply the ops for one row; returns (new line or None if deleted, ops that changed it)."""
+    if not ops and not every_row:
+        return line, 0
+    hits = 0
+    for op in ops:
+        if op["op"] == "insert":
+            writer.write_line(as_line(op["content"]))
+            hits += 1
+    for op in sorted(list(ops) + every_row, key=lambda o: o["seq"]):
+        if line is None or op["op"] == "insert":
+            continue
+        sub = op["substring"]
+        if sub is not None:
+            if sub in line:
+                line = as_line(line.replace(sub, op["content"] if op["op"] == "update" else ""))
+                hits += 1
+        elif op["op"] == "update":
+            line = as_line(op["content"])
+            hits += 1
+        else:
+            line = None
+            hits += 1
+    return line, hits
+
+
+def _append(path: str, contents: List[str]) -> None:
+    needs_newline = False
+    if os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        if needs_newline:
+            f.write("\n")
+        for text in contents:
+            f.write(as_line(text))
+
+
+class LineIndex:
+    """Byte offset of the start of every line in a file, for O(1) seeks to line N."""
+
+    def __init__(self, path: str):
+        st = os.stat(path)
+        self.signature = (st.st_size, st.st_mtime_ns)
+        self.size = st.st_size
+        self.offsets = array("Q", [0])
+        if self.size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                find = mm.find
+                pos = find(b"\n")
+                while pos != -1:
+                    self.offsets.append(pos + 1)
+                    pos = find(b"\n", pos + 1)
+        # A trailing newline doesn't start another line.
+        if self.offsets[-1] == self.size and len(self.offsets) > 1:
+            self.offsets.pop()
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets) if self.size else 0
+
+    def byte_range(self, start_line: int, end_line: int) -> tuple:
+        """Byte span of lines [start_line, end_line)."""
+        start_line = min(max(start_line, 0), self.line_count)
+        end_line = min(max(end_line, start_line), self.line_count)
+        begin = self.offsets[start_line] if start_line < self.line_count else self.size
+        end = self.offsets[end_line] if end_line < self.line_count else self.size
+        return begin, end
+
+
+_line_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+MAX_LINE_INDEXES = 64
+
+
+def line_index(path: str) -> LineIndex:
+    """Return the cached line index for `path`, rebuilding it if the file changed."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    index = _line_indexes.get(path)
+    if index is None or index.signature != (st.st_size, st.st_mtime_ns):
+        index = LineIndex(path)
+        _line_indexes[path] = index
+    _line_indexes.move_to_end(path)
+    while len(_line_indexes) > MAX_LINE_INDEXES:
+        _line_indexes.popitem(last=False)
+    return index
+
+
+def read_bytes(path: str, begin: int, end: int) -> bytes:
+    """Read bytes [begin, end) through an mmap of the file."""
+    if end <= begin:
+        return b""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm[begin:end]
+
+
+def read_lines(path: str, start_line: int, end_line: int, max_bytes: Optional[int] = None) -> dict:
+    """
+    Read lines [start_line, end_line) of a file, stopping early at max_bytes.
+
+    Returns a dict with the text, the clamped start/end lines, the byte span,
+    and the file's total_lines/total_bytes so callers can page through it.
+    If a single line is larger than max_bytes it is cut and `cut` is True.
+    """
+    index = line_index(path)
+    start_line = min(max(start_line, 0), index.line_count)
+    begin, end = index.byte_range(start_line, end_line)
+    cut = False
+    if max_bytes is not None and end - begin > max_bytes:
+        end_line = max(bisect_right(index.offsets, begin + max_bytes) - 1, start_line + 1)
+        begin, end = index.byte_range(start_line, end_line)
+        if end - begin > max_bytes:
+            end, cut = begin + max_bytes, True
+    end_line = min(max(end_line, start_line), index.line_count)
+    return {
+        "text": read_bytes(path, begin, end).decode("utf-8", errors="replace"),
+        "start_line": start_line,
+        "end_line": end_line,
+        "start_byte": begin,
+        "end_byte": end,
+        "cut": cut,
+        "total_lines": index.line_count,
+        "total_bytes": index.size,
+    }
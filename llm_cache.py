@@ -0,0 +1,167 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+MODES = ("cache", "record", "replay")
+
+
+class CacheMiss(LookupError):
+    """Raised in replay mode when a model call has no recorded response."""
+
+
+def _dump(generations: Sequence[Generation]) -> str:
+    return json.dumps([
+        {"message": message_to_dict(g.message)} if isinstance(g, ChatGeneration) else {"text": g.text}
+        for g in generations
+    ])
+
+
+# The parts of a message that determine the model's answer. Ids, usage and
+# response metadata differ between a live response and the same response
+# served from the cache, and would make every later step of a replay miss.
+KEY_FIELDS = ("content", "tool_calls", "tool_call_id", "name")
+
+
+def _normalize(prompt: str) -> str:
+    """Canonical form of a serialized message list, keeping only KEY_FIELDS."""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    normalized = []
+    for m in messages:
+        if not isinstance(m, dict) or not isinstance(m.get("kwargs"), dict):
+            normalized.append(m)
+            continue
+        kwargs = m["kwargs"]
+        entry = {"role": kwargs.get("type") or (m.get("id") or ["?"])[-1]}
+        for field in KEY_FIELDS:
+            if kwargs.get(field) not in (None, [], ""):
+                entry[field] = kwargs[field]
+        if isinstance(entry.get("content"), list):
+            # Content blocks (e.g. MCP tool results) get a fresh random id each time
+            entry["content"] = [{k: v for k, v in block.items() if k != "id"} if isinstance(block, dict) else block
+                                for block in entry["content"]]
+        if "tool_calls" in entry:
+            entry["tool_calls"] = [{k: c.get(k) for k in ("name", "args", "id")} for c in entry["tool_calls"]]
+        normalized.append(entry)
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+def _load(value: str) -> list:
+    return [
+        ChatGeneration(message=messages_from_dict([g["message"]])[0]) if "message" in g else Generation(text=g["text"])
+        for g in json.loads(value)
+    ]
+
+
+class LLMCache(BaseCache):
+    """
+    Response cache for chat models (set as the model's `cache`).
+
+    LangChain looks responses up by the serialized messages plus the model's
+    "llm string", which covers the model name, its parameters and the tools
+    bound with bind_tools, so a change to any of them is a miss. Messages
+    are reduced to KEY_FIELDS first, so ids and usage metadata don't count. Entries are
+    kept in an in-memory LRU and, with `path` set, in a SQLite file.
+
+    Modes:
+      cache  - reuse stored responses, call the model and store on a miss
+      record - always call the model and store (re)recorded responses
+      replay - only serve stored responses; a miss raises CacheMiss, so a
+               regression run never touches the network
+    """
+
+    def __init__(self, path: Optional[str] = None, mode: str = "cache", max_entries: int = 512):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.memory: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL)"
+            )
+            self.db.commit()
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{_normalize(prompt)}".encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                return value
+            if self.db is None:
+                return None
+            row = self.db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                return row[0]
+            return None
+
+    def _remember(self, key: str, value: str) -> None:
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self.key(prompt, llm_string)
+        value = None if self.mode == "record" else self._get(key)
+        if value is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise CacheMiss(f"No recorded response for this model call (key {key[:12]}); "
+                                f"record it first with mode='record' or 'cache'")
+            return None
+        self.hits += 1
+        return _load(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if self.mode == "replay":
+            return
+        key = self.key(prompt, llm_string)
+        value = _dump(return_val)
+        with self.lock:
+            self._remember(key, value)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                self.db.commit()
+
+    def clear(self, **kwargs) -> None:
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
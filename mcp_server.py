@@ -1,128 +1,463 @@
 import os
-import subprocess
 import asyncio
 import sys
-import io
-import traceback
-from contextlib import redirect_stdout, redirect_stderr
-import signal
-from io import StringIO
-from typing import List, Optional
-from langchain_community.tools import DuckDuckGoSearchRun, DuckDuckGoSearchResults
-
-search = DuckDuckGoSearchRun()
+import re
+from datetime import datetime
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
  
+from mcp.server.fastmcp import FastMCP, Context
+from python_pool import PythonWorkerPool
+from file_engine import apply_edits, read_bytes, read_lines
+from patching import patch_files
+from search_cache import CachedSearch, RateLimiter, TTLCache
+from workspace_index import glob_matcher, notify_changed, search_index, walk
+from metrics import Metrics, MetricsDumper, instrument
+from sessions import SessionManager
+from snapshots import snapshot_store
 
 
-import tempfile
- 
-from mcp.server.fastmcp import FastMCP
+@asynccontextmanager
+async def lifespan(server):
+    # Runs when a client session starts (once per session over HTTP), so
+    # run_python already has warm workers on its first call.
+    python_pool.start()
+    yield {}
+
+
+mcp= FastMCP("mcp", lifespan=lifespan)
+
+# Per-tool call counts, latency histograms, payload sizes and errors
+metrics = Metrics()
+
+
+def tool(**kwargs):
+    """mcp.tool() that also records metrics for every call."""
+    def decorator(fn):
+        return mcp.tool(**kwargs)(instrument(fn, metrics))
+    return decorator
+
+# MCP_WORKSPACE points the server at another directory (benchmarks, isolated jobs)
+DEFAULT_WORKSPACE=os.path.abspath(os.path.expanduser(os.environ.get("MCP_WORKSPACE", "~/mcp/workspace")))
+
+# Each connected agent gets its own cwd and process table (see sessions.py)
+sessions = SessionManager(DEFAULT_WORKSPACE)
+
+
+# Output cap for run_command; older output is dropped once this fills up.
+MAX_COMMAND_OUTPUT = 64 * 1024
+COMMAND_TIMEOUT = 120
+
+# Warm interpreters for run_python exec mode
+python_pool = PythonWorkerPool(size=2)
 
-mcp= FastMCP("mcp")
-DEFAULT_WORKSPACE=os.path.expanduser("~/mcp/workspace")
 
-# Track current workspace directory separately
-current_workspace_dir = DEFAULT_WORKSPACE
+def _command_summary(proc) -> str:
+    parts = [proc.output()]
+    if proc.logs.dropped:
+        parts.insert(0, f"[output truncated: first {proc.logs.dropped} bytes dropped]")
+    if proc.timed_out:
+        parts.append("[command timed out and was killed]")
+    elif proc.returncode:
+        parts.append(f"[exit code {proc.returncode}]")
+    return "\n".join(p.rstrip("\n") for p in parts if p)
 
 
-@mcp.tool()
-async def run_command(command:str)->str:
+@tool()
+async def run_command(command: str, timeout: int = COMMAND_TIMEOUT, max_output: int = MAX_COMMAND_OUTPUT, ctx: Context = None) -> str:
     """
     Run a terminal command inside the workspace directory.
+    Output is streamed back as log notifications while the command runs.
     
     Args:
         command: The shell command to run.
+        timeout: Seconds before the command is killed.
+        max_output: Max bytes of output to keep (the tail is kept).
     
     Returns:
          The commad output or error message.   
 
     """
+    async def stream(name, chunk):
+        if ctx is not None:
+            await ctx.info(f"[{name}] {chunk.decode('utf-8', errors='replace')}")
 
     try:
-        result=subprocess.run(command,shell=True,cwd=DEFAULT_WORKSPACE,capture_output=True,text=True)
-        return result.stdout or result.stderr
+        session = sessions.get(ctx)
+        proc = await session.supervisor.spawn(command, session.cwd, shell=True, timeout=timeout,
+                                              log_bytes=max_output, on_output=stream)
+        await session.supervisor.wait(proc)
+        session.supervisor.forget(proc.pid)
+        return _command_summary(proc)
     except Exception as e:
         return str(e)
+
+
+@tool()
+async def start_command(command: str, timeout: int = COMMAND_TIMEOUT, max_output: int = MAX_COMMAND_OUTPUT, ctx: Context = None) -> dict:
+    """
+    Start a terminal command in the background and return its PID right away.
+    Several commands can run at the same time; poll them with check_process_logs.
+
+    Args:
+        command: The shell command to run.
+        timeout: Seconds before the command is killed.
+        max_output: Max bytes of output to keep (the tail is kept).
+    """
+    try:
+        session = sessions.get(ctx)
+        proc = await session.supervisor.spawn(command, session.cwd, shell=True, timeout=timeout, log_bytes=max_output)
+        return {"success": True, "pid": proc.pid, "message": f"Started: {command}"}
+    except Exception as e:
+        return {"success": False, "message": f"Error starting command: {e}"}
     
     
-@mcp.tool()
-async def list_files()->str:
+LIST_PAGE_SIZE = 500
+
+
+@tool()
+async def list_files(
+    path: str = ".",
+    recursive: bool = False,
+    pattern: Optional[str] = None,
+    ignore: Optional[List[str]] = None,
+    max_depth: Optional[int] = None,
+    offset: int = 0,
+    limit: int = LIST_PAGE_SIZE,
+    details: bool = False,
+    include_ignored: bool = False,
+    ctx: Context = None,
+)->str:
     """
     List files in the workspace directory.
+    With recursive=True, lists the whole tree in one call (directories end with "/"),
+    skipping node_modules, .git and anything in .gitignore unless include_ignored is set.
     
+    Args:
+        path: Directory to list, relative to the current directory.
+        recursive: Also list everything below path.
+        pattern: Only show entries matching this glob (e.g. "*.py" or "src/*.jsx").
+        ignore: Extra globs to skip (e.g. ["dist", "*.log"]).
+        max_depth: How many directory levels to descend when recursive.
+        offset: Skip this many entries (use next offset from the previous page).
+        limit: Max entries to return.
+        details: Add size in bytes and modification time to each entry.
+        include_ignored: Don't skip node_modules/.git/.gitignore'd entries.
+
     Returns:
         A string listing the files and directories in the workspace.
     """
     try:
-        files=os.listdir(current_workspace_dir)
-        return "\n".join(files)
+        root = sessions.get(ctx).path(path)
+        if not recursive and not pattern and not details and not offset and not ignore:
+            files=os.listdir(root)
+            if len(files) <= limit:
+                return "\n".join(files)
+
+        # A flat listing shows everything except the given ignores, like os.listdir did
+        entries = walk(
+            root,
+            max_depth=(max_depth if recursive else 1),
+            ignore=ignore,
+            use_gitignore=recursive,
+            use_defaults=recursive,
+            include_ignored=include_ignored,
+        )
+        if pattern:
+            wanted = glob_matcher([pattern])
+            entries = (e for e in entries if wanted(e[0]))
+
+        lines = []
+        total = 0
+        for rel, is_dir, _ in entries:
+            if offset <= total < offset + limit:
+                line = rel + ("/" if is_dir else "")
+                if details:
+                    st = os.stat(os.path.join(root, rel))
+                    modified = datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds")
+                    line += f"\t{st.st_size if not is_dir else '-'}\t{modified}"
+                lines.append(line)
+            total += 1
+
+        if offset + len(lines) < total:
+            lines.append(f"[showing {offset}-{offset + len(lines)} of {total} entries; next offset={offset + len(lines)}]")
+        return "\n".join(lines)
     except Exception as e:
         return str(e)
 
 
  
-@mcp.tool()
-def write_file(filename: str, content: str) -> str:
+@tool()
+def write_file(filename: str, content: str, ctx: Context = None) -> str:
     """
     Write plain text content into a file in the workspace.
-    Overwrites the file if it exists.
+    Overwrites the file if it exists. To change part of an existing file, use apply_patch.
     """
-    # If path is absolute, use it as-is. Otherwise, join with workspace root
-    filepath = os.path.join(current_workspace_dir, filename)
-    
     try:
-        # Create any parent directories if missing
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+        # Relative to the current directory; must stay inside the workspace
+        filepath = sessions.get(ctx).path(filename)
+        _write_one(filepath, content)
         return f"File {filepath} created with provided content."
     except Exception as e:
         return f"Error writing file {filename}: {e}"
 
 
+def _write_one(filepath: str, content: str) -> None:
+    # Create any parent directories if missing
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(content)
+    notify_changed(filepath)
+
+
 
-@mcp.tool()
-def read_file(filename: str) -> str:
+# Files bigger than this are returned one page at a time
+MAX_READ_BYTES = 64 * 1024
+READ_PAGE_LINES = 500
+
+
+@tool()
+def read_file(
+    filename: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    start_byte: Optional[int] = None,
+    end_byte: Optional[int] = None,
+    ctx: Context = None,
+) -> str:
     """
     Read and return the content of a file in the workspace.
+    Small files are returned whole. For large files, or when a range is given, only
+    that part is returned, after a header line with the total size, line count and
+    where the next page starts.
+
+    Args:
+        filename: Path to the file (relative to workspace).
+        start_line: First line to read (0-based, same numbering as the edit tools).
+        end_line: Line to stop before (exclusive).
+        start_byte: Read from this byte offset instead of by lines.
+        end_byte: Byte offset to stop before (exclusive).
     """
-    filepath = os.path.join(current_workspace_dir, filename)
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return f.read()
+        filepath = sessions.get(ctx).path(filename)
+        return _read_one(filepath, filename, start_line, end_line, start_byte, end_byte)
     except Exception as e:
         return f"Error reading file {filename}: {e}"
 
 
+def _read_one(filepath: str, filename: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+              start_byte: Optional[int] = None, end_byte: Optional[int] = None) -> str:
+    size = os.path.getsize(filepath)
+    by_lines = start_line is not None or end_line is not None
+    by_bytes = start_byte is not None or end_byte is not None
+
+    if not by_lines and not by_bytes and size <= MAX_READ_BYTES:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return f.read()
+
+    if by_bytes:
+        begin = max(start_byte or 0, 0)
+        end = min(size if end_byte is None else end_byte, size, begin + MAX_READ_BYTES)
+        text = read_bytes(filepath, begin, end).decode("utf-8", errors="replace")
+        more = f"next start_byte={end}" if end < size else "end of file"
+        return f"[{filename}: bytes {begin}-{end} of {size}; {more}]\n{text}"
+
+    start = start_line or 0
+    page = read_lines(filepath, start, end_line if end_line is not None else start + READ_PAGE_LINES, MAX_READ_BYTES)
+    if page["cut"]:
+        more = f"line {page['start_line']} is too long, continue with start_byte={page['end_byte']}"
+    elif page["end_line"] < page["total_lines"]:
+        more = f"next start_line={page['end_line']}"
+    else:
+        more = "end of file"
+    header = (f"[{filename}: lines {page['start_line']}-{page['end_line']} of {page['total_lines']} "
+              f"({page['total_bytes']} bytes); {more}]")
+    return f"{header}\n{page['text']}"
+
+
+# Batch file tools: one call (and one LLM step) for many files, I/O done in parallel
+file_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="file-io")
+MAX_BATCH_FILES = 100
+MAX_BATCH_READ_BYTES = 256 * 1024
+
+RANGE_KEYS = ("start_line", "end_line", "start_byte", "end_byte")
 
-@mcp.tool()
-def current_working_directory() -> str:
+
+def _batch_entry(entry) -> dict:
+    """A batch item is a path or a dict with "filename" and, for reads, optional ranges."""
+    if isinstance(entry, str):
+        return {"filename": entry}
+    if not isinstance(entry, dict) or not entry.get("filename"):
+        raise ValueError(f"expected a path or an object with a filename, got {entry!r}")
+    return entry
+
+
+async def _run_batch(items: list, fn) -> list:
+    """Run fn(item) for every item on the file pool; an exception becomes that item's error."""
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(loop.run_in_executor(file_pool, fn, item) for item in items),
+                                   return_exceptions=True)
+    return [{"filename": item["filename"], "error": str(r)} if isinstance(r, BaseException) else r
+            for item, r in zip(items, results)]
+
+
+def _batch_result(results: list, verb: str) -> dict:
+    failed = sum("error" in r for r in results)
+    return {
+        "success": not failed,
+        "message": f"{verb} {len(results) - failed} of {len(results)} file(s)" + (f", {failed} failed" if failed else ""),
+        "files": results,
+    }
+
+
+@tool()
+async def read_files(files: List[Union[str, dict]], ctx: Context = None) -> dict:
+    """
+    Read several files in one call instead of calling read_file for each.
+    Each file is returned like read_file would (large files one page at a time);
+    a file that can't be read gets an "error" instead of "content" and the others
+    are still returned.
+
+    Args:
+        files: Paths (relative to workspace), or objects like
+            {"filename": "src/app.py", "start_line": 0, "end_line": 100}
+            with the same optional start_line/end_line/start_byte/end_byte as read_file.
+    """
+    if len(files) > MAX_BATCH_FILES:
+        return {"success": False, "message": f"At most {MAX_BATCH_FILES} files per call."}
+    session = sessions.get(ctx)
+    items = []
+    for entry in files:
+        try:
+            items.append(_batch_entry(entry))
+        except ValueError as e:
+            items.append({"filename": str(entry), "invalid": str(e)})
+
+    def read(item: dict) -> dict:
+        if "invalid" in item:
+            raise ValueError(item["invalid"])
+        ranges = {k: item.get(k) for k in RANGE_KEYS}
+        return {"filename": item["filename"],
+                "content": _read_one(session.path(item["filename"]), item["filename"], **ranges)}
+
+    results = await _run_batch(items, read)
+    # Keep the whole reply bounded; later files have to be read in another call
+    total = 0
+    for r in results:
+        if "content" not in r:
+            continue
+        total += len(r["content"])
+        if total > MAX_BATCH_READ_BYTES:
+            del r["content"]
+            r["error"] = "skipped: this call's output limit was reached, read it in another call"
+    return _batch_result(results, "Read")
+
+
+@tool()
+async def write_files(files: List[dict], ctx: Context = None) -> dict:
+    """
+    Write several files in one call instead of calling write_file for each,
+    e.g. to scaffold a project. Each file is created or overwritten, with parent
+    directories created as needed. Files that fail get an "error"; the rest are
+    still written.
+
+    Args:
+        files: Objects like {"filename": "src/app.py", "content": "..."} (paths relative to workspace).
+    """
+    if len(files) > MAX_BATCH_FILES:
+        return {"success": False, "message": f"At most {MAX_BATCH_FILES} files per call."}
+    session = sessions.get(ctx)
+    items, seen = [], set()
+    for entry in files:
+        try:
+            item = _batch_entry(entry)
+            if not isinstance(item.get("content"), str):
+                raise ValueError(f"{item['filename']}: content must be a string")
+            path = os.path.abspath(session.path(item["filename"]))
+            if path in seen:
+                raise ValueError(f"{item['filename']} appears more than once in this call")
+            seen.add(path)
+            items.append({**item, "path": path})
+        except ValueError as e:
+            items.append({"filename": str(entry.get("filename")), "invalid": str(e)})
+
+    def write(item: dict) -> dict:
+        if "invalid" in item:
+            raise ValueError(item["invalid"])
+        _write_one(item["path"], item["content"])
+        return {"filename": item["filename"], "bytes": len(item["content"].encode("utf-8"))}
+
+    return _batch_result(await _run_batch(items, write), "Wrote")
+
+
+
+@tool()
+async def search_workspace(
+    query: str,
+    regex: bool = False,
+    case_sensitive: bool = False,
+    path: str = ".",
+    glob: Optional[str] = None,
+    max_results: int = 100,
+    ctx: Context = None,
+) -> str:
+    """
+    Search file contents in the workspace, like grep -rn but backed by an index
+    (node_modules, .git and .gitignore'd files are skipped).
+    Use this instead of running grep with run_command.
+
+    Args:
+        query: Text (or regular expression if regex=True) to look for.
+        regex: Treat query as a Python regular expression.
+        case_sensitive: Match case exactly.
+        path: Only search under this directory (relative to the current directory).
+        glob: Only search files matching this glob (e.g. "*.jsx" or "src/*.py").
+        max_results: Stop after this many matching lines.
+
+    Returns:
+        One "file:row: line" per match (rows are 0-based, like the edit tools).
+    """
+    try:
+        session = sessions.get(ctx)
+        scope = os.path.abspath(session.path(path))
+        root = session.root
+        prefix = os.path.relpath(scope, root).replace(os.sep, "/")
+        index = search_index(root)
+        results, truncated = await asyncio.to_thread(
+            index.search, query, regex, case_sensitive, "" if prefix == "." else prefix, glob, max_results
+        )
+        if not results:
+            return f"No matches for {query!r}."
+        lines = [f"{rel}:{row}: {line}" for rel, row, line in results]
+        if truncated:
+            lines.append(f"[stopped after {max_results} matches]")
+        return "\n".join(lines)
+    except re.error as e:
+        return f"Invalid regular expression: {e}"
+    except Exception as e:
+        return f"Error searching workspace: {e}"
+
+
+@tool()
+def current_working_directory(ctx: Context = None) -> str:
     """ 
     Get the current logical working directory (inside the workspace).
     """
-    return current_workspace_dir
+    return sessions.get(ctx).cwd
 
 
  
 
 
-@mcp.tool()
-def change_directory(path: str) -> str:
+@tool()
+def change_directory(path: str, ctx: Context = None) -> str:
     """Change the current logical working directory (restricted inside workspace)."""
-    global current_workspace_dir
     try:
-        new_path = os.path.abspath(os.path.join(current_workspace_dir, path))
-
-        # Windows-safe check: ensure new_path stays inside DEFAULT_WORKSPACE
-        if os.path.commonpath([DEFAULT_WORKSPACE, new_path]) != os.path.abspath(DEFAULT_WORKSPACE):
-            return f"Error: Cannot leave the workspace directory."
-
-        if not os.path.isdir(new_path):
-            return f"Error: Directory does not exist: {new_path}"
-
-        current_workspace_dir = new_path
-        return f"Changed directory to {current_workspace_dir}"
+        return f"Changed directory to {sessions.get(ctx).chdir(path)}"
+    except ValueError as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"Error changing directory: {e}"
     
@@ -131,7 +466,7 @@ def change_directory(path: str) -> str:
 
 
 
-@mcp.tool()
+@tool()
 def os_name()->str:
     ''' 
     Get the name of the operating system.'''
@@ -139,24 +474,26 @@ def os_name()->str:
     return os.name
     
  
-# Keep track of running processes (for long-lived apps like FastAPI)
-running_processes = {}
-
-@mcp.tool()
-def run_python(filename: str, mode: str = "auto", timeout: int = 15) -> dict:
+@tool()
+async def run_python(filename: str, mode: str = "auto", timeout: int = 15, ctx: Context = None) -> dict:
     """
     Run a Python file in different modes.
 
     Args:
-        filename (str): The Python file to run (relative to DEFAULT_WORKSPACE).
+        filename (str): The Python file to run (relative to the current directory).
         mode (str): "auto", "exec", or "subprocess"
             - auto: chooses best mode automatically
-            - exec: runs via exec (good for small scripts)
-            - subprocess: runs via subprocess.Popen (good for apps like FastAPI)
+            - exec: runs in a warm, isolated worker process (good for small scripts)
+            - subprocess: runs as a supervised background process (good for apps like FastAPI)
         timeout (int): Max seconds for exec mode. Ignored for subprocess.
     """
-    filepath = os.path.join(DEFAULT_WORKSPACE, filename)
+    session = sessions.get(ctx)
     result = {"success": False, "output": "", "error": "", "pid": None}
+    try:
+        filepath = session.path(filename)
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
 
     if not os.path.exists(filepath):
         result["error"] = f"File not found: {filepath}"
@@ -174,36 +511,17 @@ def run_python(filename: str, mode: str = "auto", timeout: int = 15) -> dict:
 
         # -------- exec mode (fast, short scripts) --------
         if mode == "exec":
-            stdout_buffer = StringIO()
-            old_stdout = sys.stdout
-            sys.stdout = stdout_buffer
-            try:
-                with open(filepath, "r") as f:
-                    code = f.read()
-                exec_globals = {"__name__": "__main__", "__file__": filepath}
-                exec(code, exec_globals)
-                result["success"] = True
-                result["output"] = stdout_buffer.getvalue()
-            except Exception as e:
-                result["error"] = f"{type(e).__name__}: {str(e)}"
-            finally:
-                sys.stdout = old_stdout
+            run = await python_pool.run(filepath, session.cwd, timeout=timeout)
+            result.update(run)
 
         # -------- subprocess mode (for apps, servers) --------
         elif mode == "subprocess":
-            process = subprocess.Popen(
-                [sys.executable, filepath],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd=DEFAULT_WORKSPACE,
-            )
-            running_processes[process.pid] = process
+            proc = await session.supervisor.spawn([sys.executable, "-u", filepath], session.cwd)
             result.update({
                 "success": True,
                 "mode": mode,
-                "output": f"Started process PID={process.pid}",
-                "pid": process.pid,
+                "output": f"Started process PID={proc.pid}. Use check_process_logs to see its output.",
+                "pid": proc.pid,
             })
 
     except Exception as e:
@@ -212,74 +530,111 @@ def run_python(filename: str, mode: str = "auto", timeout: int = 15) -> dict:
     return result
 
 
-@mcp.tool()
-def stop_process(pid: int) -> dict:
+@tool()
+async def stop_process(pid: int, ctx: Context = None) -> dict:
     """
-    Stop a running Python process by PID.
+    Stop a running process (and its children) by PID.
     """
     result = {"success": False, "message": ""}
-    process = running_processes.pop(pid, None)
-
-    if process:
-        try:
-            process.terminate()
-            result.update({"success": True, "message": f"Process {pid} terminated."})
-        except Exception as e:
-            result["message"] = f"Error stopping process {pid}: {e}"
-    else:
-        result["message"] = f"No running process with PID {pid}"
+    try:
+        proc = await sessions.get(ctx).supervisor.stop(pid)
+        if proc:
+            result.update({"success": True, "message": f"Process {pid} terminated. Exit code: {proc.returncode}"})
+        else:
+            result["message"] = f"No running process with PID {pid}"
+    except Exception as e:
+        result["message"] = f"Error stopping process {pid}: {e}"
 
     return result
 
   
-@mcp.tool()
-def check_process_logs(pid: int) -> str:
-    try:
-        import psutil
-        proc = psutil.Process(pid)
-        if proc.is_running():
-            return f"Process {pid} is running ({proc.status()})"
-        return f"Process {pid} finished. Exit code: {getattr(proc, 'returncode', 'unknown')}"
-    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-        return f"No accessible process found with PID {pid}"
-    except Exception as e:
-        return f"Unexpected error: {str(e)}"
+@tool()
+async def check_process_logs(pid: int, offset: Optional[int] = None, tail: int = 50, wait: float = 0,
+                             ctx: Context = None) -> dict:
+    """
+    Get status, exit code, CPU/memory usage and logs of a process started by a tool.
+
+    Args:
+        pid: PID returned by the tool that started the process.
+        offset: Byte offset to read logs from; pass back next_offset to get only new output.
+            If not set, the last `tail` lines are returned instead.
+        tail: Number of trailing log lines to return when offset is not set.
+        wait: Seconds to wait for the process to exit before returning.
+    """
+    supervisor = sessions.get(ctx).supervisor
+    proc = supervisor.get(pid)
+    if proc is None:
+        return {"success": False, "message": f"No process found with PID {pid}"}
+
+    if wait > 0:
+        await supervisor.wait(proc, wait)
+
+    if offset is None:
+        chunk, next_offset = proc.logs.tail(tail), proc.logs.end
+    else:
+        chunk, next_offset = proc.logs.read(offset)
+
+    return {
+        "success": True,
+        **proc.info(),
+        "logs": chunk.decode("utf-8", errors="replace"),
+        "next_offset": next_offset,
+        "dropped_bytes": proc.logs.dropped,
+    }
+
+
+@tool()
+def list_processes(ctx: Context = None) -> list:
+    """
+    List processes started by tools in this session, with status, exit codes and resource usage.
+    """
+    return [p.info() for p in sessions.get(ctx).supervisor.processes.values()]
+
+
+@tool()
+def reap_processes(ctx: Context = None) -> dict:
+    """
+    Remove finished processes (and their logs) from the process table.
+    """
+    return {"success": True, "removed": sessions.get(ctx).supervisor.reap()}
 
 
-@mcp.tool()
-def create_react_app_vite(app_name: str, template: str = "react") -> dict:
+@tool()
+async def create_react_app_vite(app_name: str, template: str = "react", ctx: Context = None) -> dict:
     """
     Creates a Vite app using `npm create vite@latest` in the background. 
     so once the tool runs it instantly returns and 
     also creates log_file which updates the execution later you can open it and see the result.
+    The logs can also be read with check_process_logs.
     """
-    global current_workspace_dir
-    app_path = os.path.join(current_workspace_dir, app_name)
-    log_file = os.path.join(DEFAULT_WORKSPACE, f"{app_name}_vite_logs.txt")
+    session = sessions.get(ctx)
+    try:
+        app_path = session.path(app_name)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    log_file = os.path.join(session.root, f"{app_name}_vite_logs.txt")
     
     if os.path.exists(app_path):
         return {"success": False, "message": f"Folder {app_name} already exists."}
     
     try:
-        with open(log_file, "w") as f:
-            process = subprocess.Popen(
-                ["npm", "create", "vite@latest", app_name, "--", "--template", template],
-                cwd=DEFAULT_WORKSPACE,
-                stdout=f,
-                stderr=f,
-                text=True,
-                shell=(os.name == "nt")
-            )
+        open(log_file, "w").close()
+        proc = await session.supervisor.spawn(
+            ["npm", "create", "vite@latest", app_name, "--", "--template", template],
+            session.cwd,
+            shell=(os.name == "nt"),
+            log_file=log_file,
+        )
         return {
             "success": True,
-            "pid": process.pid,
+            "pid": proc.pid,
             "message": f"Started Vite app creation for {app_name}. Logs at {log_file}",
         }
     except Exception as e:
         return {"success": False, "message": f"Error starting Vite app: {e}"}
 
-@mcp.tool()
-def install_npm_packages(packages: str = "") -> dict:
+@tool()
+async def install_npm_packages(packages: str = "", ctx: Context = None) -> dict:
     """
     Install npm packages in the workspace.
     - If `packages` is empty, runs `npm install` from package.json.
@@ -292,29 +647,24 @@ def install_npm_packages(packages: str = "") -> dict:
         if packages.strip():
             cmd += packages.split()
 
-        process = subprocess.Popen(
-            cmd,
-            cwd=current_workspace_dir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        session = sessions.get(ctx)
+        proc = await session.supervisor.spawn(cmd, session.cwd)
 
         return {
             "success": True,
-            "pid": process.pid,
+            "pid": proc.pid,
             "message": f"Started: {' '.join(cmd)} in background. Use PID with check_process_logs to see logs."
         }
     except Exception as e:
         return {"success": False, "message": f"Error running npm install: {e}"}
 
 
-@mcp.tool()
-def create_changelog(version: str, changes: str) -> str:
+@tool()
+def create_changelog(version: str, changes: str, ctx: Context = None) -> str:
     """
     Create or append to a CHANGELOG.md file in the workspace.
     """
-    changelog_path = os.path.join(current_workspace_dir, "CHANGELOG.md")
+    changelog_path = sessions.get(ctx).path("CHANGELOG.md")
     try:
         with open(changelog_path, "a", encoding="utf-8") as f:
             f.write(f"## Version {version}\n")
@@ -325,12 +675,13 @@ def create_changelog(version: str, changes: str) -> str:
         return f"Error updating changelog: {e}"
 
 
-@mcp.tool()
+@tool()
 async def insert_file_content(
     filename: str, 
     content: str, 
     row: Optional[int] = None, 
-    rows: Optional[List[int]] = None
+    rows: Optional[List[int]] = None,
+    ctx: Context = None,
 ) -> str:
     """
     Insert content at specific row(s) in a file inside the workspace.
@@ -341,61 +692,23 @@ async def insert_file_content(
         row: Row number to insert at (0-based, optional).
         rows: List of row numbers to insert at (0-based, optional).
     """
-    filepath = os.path.join(current_workspace_dir, filename)
-
     try:
-        # Handle non-string content (dict, list, etc.)
-        if not isinstance(content, str):
-            import json
-            content = json.dumps(content, indent=4, ensure_ascii=False, default=str)
-
-        if content and not content.endswith('\n'):
-            content += '\n'
-
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-
-        if not os.path.exists(filepath):
-            open(filepath, 'w').close()
-
-        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-
-        for i in range(len(lines)):
-            if lines[i] and not lines[i].endswith('\n'):
-                lines[i] += '\n'
-
-        content_lines = content.splitlines(True)
-
-        if rows is not None:
-            rows = sorted(rows, reverse=True)
-            for r in rows:
-                if r > len(lines):
-                    lines.extend(['\n'] * (r - len(lines)))
-                for line in reversed(content_lines):
-                    lines.insert(r, line)
-        elif row is not None:
-            if row > len(lines):
-                lines.extend(['\n'] * (row - len(lines)))
-            for line in reversed(content_lines):
-                lines.insert(row, line)
-        else:
-            lines.extend(content_lines)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
-
+        filepath = sessions.get(ctx).path(filename)
+        apply_edits(filepath, [{"op": "insert", "content": content, "row": row, "rows": rows}], create=True)
+        notify_changed(filepath)
         return f"Inserted content into '{filepath}'."
 
     except Exception as e:
         return f"Error inserting content into {filename}: {e}"
 
 
-@mcp.tool()
+@tool()
 async def delete_file_content(
     filename: str, 
     row: Optional[int] = None, 
     rows: Optional[List[int]] = None, 
-    substring: Optional[str] = None
+    substring: Optional[str] = None,
+    ctx: Context = None,
 ) -> str:
     """
     Delete content from a file inside the workspace.
@@ -406,42 +719,15 @@ async def delete_file_content(
         rows: List of row numbers to delete (0-based).
         substring: If set, remove only this substring instead of whole row(s).
     """
-    filepath = os.path.join(current_workspace_dir, filename)
-
     try:
+        filepath = sessions.get(ctx).path(filename)
         if not os.path.isfile(filepath):
             return f"Error: File '{filepath}' does not exist."
 
-        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-
-        total_lines = len(lines)
-        modified = False
-
-        if substring is not None:
-            targets = rows if rows is not None else ([row] if row is not None else range(total_lines))
-            for r in targets:
-                if isinstance(r, int) and 0 <= r < total_lines and substring in lines[r]:
-                    lines[r] = lines[r].replace(substring, '')
-                    if not lines[r].endswith('\n'):
-                        lines[r] += '\n'
-                    modified = True
-        elif rows is not None:
-            for r in sorted(rows, reverse=True):
-                if 0 <= r < total_lines:
-                    lines.pop(r)
-                    modified = True
-        elif row is not None:
-            if 0 <= row < total_lines:
-                lines.pop(row)
-                modified = True
-        else:
-            lines = []
-            modified = True
+        changed = apply_edits(filepath, [{"op": "delete", "row": row, "rows": rows, "substring": substring}])
+        notify_changed(filepath)
 
-        if modified:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
+        if changed:
             return f"Updated file '{filepath}' successfully."
         else:
             return f"No matching rows or substrings found in '{filepath}'."
@@ -451,13 +737,14 @@ async def delete_file_content(
 
 
  
-@mcp.tool()
+@tool()
 async def update_file_content(
     filename: str, 
     content: str, 
     row: Optional[int] = None, 
     rows: Optional[List[int]] = None, 
-    substring: Optional[str] = None
+    substring: Optional[str] = None,
+    ctx: Context = None,
 ) -> str:
     """
     Update content at specific row(s) in a file inside the workspace.
@@ -469,46 +756,15 @@ async def update_file_content(
         rows: List of row numbers to update (0-based).
         substring: If set, replace only this substring in the row(s).
     """
-    filepath = os.path.join(current_workspace_dir, filename)
-
     try:
+        filepath = sessions.get(ctx).path(filename)
         if not os.path.isfile(filepath):
             return f"Error: File '{filepath}' does not exist."
 
-        if not isinstance(content, str):
-            import json
-            content = json.dumps(content, indent=4, ensure_ascii=False, default=str)
-
-        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-
-        total_lines = len(lines)
-        modified = False
-
-        if substring is not None:
-            targets = rows if rows is not None else ([row] if row is not None else range(total_lines))
-            for r in targets:
-                if isinstance(r, int) and 0 <= r < total_lines and substring in lines[r]:
-                    lines[r] = lines[r].replace(substring, content)
-                    if not lines[r].endswith('\n'):
-                        lines[r] += '\n'
-                    modified = True
-        elif rows is not None:
-            for r in rows:
-                if 0 <= r < total_lines:
-                    lines[r] = (content if content.endswith('\n') else content + '\n')
-                    modified = True
-        elif row is not None:
-            if 0 <= row < total_lines:
-                lines[row] = (content if content.endswith('\n') else content + '\n')
-                modified = True
-        else:
-            lines = [content if content.endswith('\n') else content + '\n']
-            modified = True
+        changed = apply_edits(filepath, [{"op": "update", "content": content, "row": row, "rows": rows, "substring": substring}])
+        notify_changed(filepath)
 
-        if modified:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
+        if changed:
             return f"Updated file '{filepath}' successfully."
         else:
             return f"No updates applied to '{filepath}'."
@@ -517,10 +773,182 @@ async def update_file_content(
         return f"Error updating content in {filename}: {e}"
 
 
+@tool()
+async def edit_file(filename: str, edits: List[dict], create: bool = False, ctx: Context = None) -> str:
+    """
+    Apply many insert/update/delete edits to one file in a single pass.
+    Prefer this over several insert/update/delete_file_content calls on the same file.
+
+    Args:
+        filename: Path to the file (relative to workspace).
+        edits: List of edits, each like
+            {"op": "insert" | "update" | "delete", "row": 3, "content": "...", "substring": "..."}.
+            "rows" (list) can be used instead of "row". Rows are 0-based and always refer
+            to the file as it was BEFORE any of these edits, so no offset math is needed.
+            Without a row, update/delete with substring apply to every line.
+        create: Create the file if it does not exist.
+    """
+    try:
+        filepath = sessions.get(ctx).path(filename)
+        changed = apply_edits(filepath, edits, create=create)
+        notify_changed(filepath)
+        if changed:
+            return f"Applied {changed} edit(s) to '{filepath}'."
+        return f"No edits applied to '{filepath}'."
+    except Exception as e:
+        return f"Error editing {filename}: {e}"
+
+
+@tool()
+async def apply_patch(patch: str, filename: Optional[str] = None, check: bool = False, ctx: Context = None) -> str:
+    """
+    Change existing files by sending only what changes, instead of rewriting them with write_file.
+    Much cheaper for small changes to large files.
+
+    The patch is either a unified diff (as from `git diff`; several files allowed,
+    --- /dev/null creates a file) or one or more blocks of:
+
+        path/to/file.py
+        <<<<<<< SEARCH
+        exact lines currently in the file
+        =======
+        lines to put there instead
+        >>>>>>> REPLACE
 
+    Hunks are matched exactly, then ignoring whitespace, then approximately, so
+    slightly stale context or wrong line numbers still apply. Every hunk is checked
+    before anything is written; if one fails, no file is changed and the error
+    shows what the file actually contains there.
 
-@mcp.tool()
-def web_search(query: str) -> str:
+    Args:
+        patch: The unified diff or SEARCH/REPLACE blocks.
+        filename: File to patch when the patch doesn't name it (relative to workspace).
+        check: Only validate the patch, don't write.
+    """
+    session = sessions.get(ctx)
+
+    def resolve(path: str) -> str:
+        return os.path.abspath(session.path(path))
+
+    try:
+        results = await asyncio.to_thread(patch_files, patch, resolve, filename, check)
+    except Exception as e:
+        return f"Error applying patch: {e}"
+
+    lines = []
+    for r in results:
+        if not check:
+            notify_changed(r["path"])
+        if r["delete"]:
+            lines.append(f"{r['name']}: {'would be ' if check else ''}deleted")
+            continue
+        notes = f" ({'; '.join(r['notes'])})" if r["notes"] else ""
+        lines.append(f"{r['name']}: {r['hunks']} hunk(s) {'apply' if check else 'applied'}{notes}")
+    return "\n".join(lines)
+
+
+@tool()
+async def snapshot_workspace(label: str = "", ctx: Context = None) -> dict:
+    """
+    Save the current state of the workspace files so it can be restored later with
+    restore_snapshot. Cheap (only changed files are stored): take one before any
+    risky change. node_modules, .git and .gitignore'd files are not included.
+
+    Args:
+        label: Short note about what the snapshot is for.
+    """
+    try:
+        store = snapshot_store(sessions.get(ctx).root)
+        result = await asyncio.to_thread(store.snapshot, label)
+        return {"success": True, **result,
+                "message": f"Snapshot {result['id']} saved ({result['changed']} changed file(s))."}
+    except Exception as e:
+        return {"success": False, "message": f"Error taking snapshot: {e}"}
+
+
+@tool()
+async def restore_snapshot(snapshot_id: str, ctx: Context = None) -> dict:
+    """
+    Roll the workspace files back to a snapshot from snapshot_workspace: changed files
+    are rewritten, deleted ones recreated and files created since are removed.
+    The state before the restore is saved as a new snapshot, so it can be undone.
+    Running processes are not touched.
+
+    Args:
+        snapshot_id: Id returned by snapshot_workspace (see also diff_snapshot).
+    """
+    try:
+        session = sessions.get(ctx)
+        result = await asyncio.to_thread(snapshot_store(session.root).restore, snapshot_id)
+        for rel in result["written"] + result["removed"]:
+            notify_changed(os.path.join(session.root, rel))
+        return {"success": True, **result,
+                "message": f"Restored snapshot {snapshot_id}: {len(result['written'])} file(s) written, "
+                           f"{len(result['removed'])} removed. Previous state saved as snapshot {result['backup']}."}
+    except KeyError as e:
+        return {"success": False, "message": e.args[0]}
+    except Exception as e:
+        return {"success": False, "message": f"Error restoring snapshot: {e}"}
+
+
+@tool()
+async def diff_snapshot(snapshot_id: Optional[str] = None, other: Optional[str] = None, patch: bool = False,
+                        ctx: Context = None) -> str:
+    """
+    Show what changed since a snapshot: files added, removed and modified.
+    Without a snapshot_id, lists the snapshots instead.
+
+    Args:
+        snapshot_id: Snapshot to compare from.
+        other: Snapshot to compare to (default: the current workspace).
+        patch: Include a unified diff of the changes (truncated if very long).
+    """
+    try:
+        store = snapshot_store(sessions.get(ctx).root)
+        if snapshot_id is None:
+            snapshots = await asyncio.to_thread(store.list_snapshots)
+            if not snapshots:
+                return "No snapshots yet."
+            return "\n".join(f"{s['id']}\t{datetime.fromtimestamp(s['created']).isoformat(timespec='seconds')}"
+                             f"\t{s['files']} files\t{s['label']}" for s in snapshots)
+        if patch:
+            text = await asyncio.to_thread(store.unified_diff, snapshot_id, other)
+            return text or "No changes."
+        changes, _, _ = await asyncio.to_thread(store.diff, snapshot_id, other)
+        lines = [f"{mark} {rel}" for key, mark in (("added", "A"), ("modified", "M"), ("removed", "D"))
+                 for rel in changes[key]]
+        return "\n".join(lines) or "No changes."
+    except KeyError as e:
+        return f"Error: {e.args[0]}"
+    except Exception as e:
+        return f"Error diffing snapshot: {e}"
+
+
+
+
+# langchain_community is slow to import, so it is only loaded on the first search
+_search_tool = None
+
+
+def _duckduckgo():
+    global _search_tool
+    if _search_tool is None:
+        from langchain_community.tools import DuckDuckGoSearchRun
+        _search_tool = DuckDuckGoSearchRun()
+    return _search_tool
+
+
+# Repeated queries (the planning and implementation agents often ask the same thing)
+# are served from cache; set WEB_SEARCH_CACHE to a file path to keep it across restarts.
+cached_search = CachedSearch(
+    lambda query: _duckduckgo().invoke(query),
+    cache=TTLCache(max_entries=256, ttl=6 * 3600, path=os.environ.get("WEB_SEARCH_CACHE")),
+    limiter=RateLimiter(rate=1.0, burst=3),
+)
+
+
+@tool()
+async def web_search(query: str) -> str:
     """
     Perform a web search using DuckDuckGo and return the top results.
     
@@ -528,11 +956,13 @@ def web_search(query: str) -> str:
         query: The search query string.
          returns: A string containing the top search results.
         """
-    result=search.invoke(query)
-    return result
+    try:
+        return await cached_search.search(query)
+    except Exception as e:
+        return f"Error searching the web: {e}"
 
 
-@mcp.tool()
+@tool()
 async def ask_user_question(agent_question: str) -> str:
     """
     MCP tool that displays Agent 1's question to the user if the agent wants to understand the requiments or any doubts,
@@ -553,9 +983,50 @@ async def ask_user_question(agent_question: str) -> str:
 
     return user_answer
 
+@tool()
+def get_metrics(format: str = "json"):
+    """
+    Call counts, latency percentiles (ms), payload sizes and error counts for every tool
+    since the server started.
+
+    Args:
+        format: "json" for a summary dict, or "prometheus" for Prometheus text format.
+    """
+    if format == "prometheus":
+        return metrics.prometheus()
+    return metrics.snapshot()
+
+
 if __name__ == "__main__":
-    print("Starting Terminal Server on stdio...")
-    mcp.run(transport="stdio")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MCP workspace server")
+    parser.add_argument("--http", action="store_true",
+                        help="Run as a long-lived daemon over streamable HTTP instead of stdio, "
+                             "so caches, indexes and processes survive across agent sessions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--isolate-sessions", action="store_true",
+                        help="give every client session its own directory under the workspace "
+                             "instead of a shared one (each session always has its own cwd and processes)")
+    parser.add_argument("--metrics-file", default=os.environ.get("MCP_METRICS_FILE"),
+                        help="periodically write tool metrics here: Prometheus text if it ends in .prom, "
+                             "JSONL snapshots otherwise (default: $MCP_METRICS_FILE)")
+    parser.add_argument("--metrics-interval", type=float, default=60, help="seconds between metrics dumps")
+    args = parser.parse_args()
+
+    sessions.isolate = args.isolate_sessions
+    if args.metrics_file:
+        MetricsDumper(metrics, args.metrics_file, args.metrics_interval).start()
+
+    if args.http:
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port
+        print(f"Starting Terminal Server on http://{args.host}:{args.port}{mcp.settings.streamable_http_path}")
+        mcp.run(transport="streamable-http")
+    else:
+        print("Starting Terminal Server on stdio...", file=sys.stderr)
+        mcp.run(transport="stdio")
  
 
 # try:
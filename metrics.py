@@ -0,0 +1,209 @@
+import atexit
+import functools
+import inspect
+import json
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from file_engine import atomic_write
+
+# Latency histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, float("inf"))
+
+
+class Stat:
+    """Call count, errors, byte totals and a latency histogram for one name."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.extra: Dict[str, float] = {}
+
+    def observe(self, ms: float, bytes_in: int = 0, bytes_out: int = 0, error: bool = False) -> None:
+        self.count += 1
+        self.errors += int(error)
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound if bound != float("inf") else round(self.max_ms, 2)
+        return round(self.max_ms, 2)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0,
+            "p50_ms": self.quantile(0.5),
+            "p90_ms": self.quantile(0.9),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 2),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            **self.extra,
+        }
+
+
+class Metrics:
+    """Thread-safe registry of Stats, grouped by kind ("tool", "llm", ...)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, Stat]] = {}
+        self.started = time.time()
+
+    def observe(self, kind: str, name: str, ms: float, bytes_in: int = 0, bytes_out: int = 0,
+                error: bool = False, **extra: float) -> None:
+        with self.lock:
+            stat = self.stats.setdefault(kind, {}).setdefault(name, Stat())
+            stat.observe(ms, bytes_in, bytes_out, error)
+            for key, value in extra.items():
+                stat.extra[key] = stat.extra.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "timestamp": time.time(),
+                "uptime_s": round(time.time() - self.started, 1),
+                **{kind: {name: s.summary() for name, s in sorted(stats.items())}
+                   for kind, stats in self.stats.items()},
+            }
+
+    def prometheus(self, prefix: str = "mcp") -> str:
+        """Prometheus text exposition format."""
+        lines: List[str] = []
+        with self.lock:
+            for kind, stats in self.stats.items():
+                metric = f"{prefix}_{kind}"
+                lines.append(f"# TYPE {metric}_duration_ms histogram")
+                for name, s in sorted(stats.items()):
+                    label = f'name="{name}"'
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS_MS, s.buckets):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else str(bound)
+                        lines.append(f'{metric}_duration_ms_bucket{{{label},le="{le}"}} {cumulative}')
+                    lines.append(f"{metric}_duration_ms_sum{{{label}}} {round(s.total_ms, 3)}")
+                    lines.append(f"{metric}_duration_ms_count{{{label}}} {s.count}")
+                    lines.append(f"{metric}_errors_total{{{label}}} {s.errors}")
+                    lines.append(f"{metric}_bytes_in_total{{{label}}} {s.bytes_in}")
+                    lines.append(f"{metric}_bytes_out_total{{{label}}} {s.bytes_out}")
+                    for key, value in s.extra.items():
+                        lines.append(f"{metric}_{key}_total{{{label}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def payload_size(value) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8", errors="replace"))
+    try:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+def is_error(result) -> bool:
+    """Tools report most failures in their result rather than by raising."""
+    if isinstance(result, str):
+        return result.startswith("Error")
+    if isinstance(result, dict):
+        return result.get("success") is False or bool(result.get("error"))
+    return False
+
+
+def instrument(fn, metrics: Metrics, kind: str = "tool"):
+    """
+    Wrap a sync or async function so every call records its latency, the size
+    of its arguments and result, and whether it failed. The signature and
+    annotations are kept, so FastMCP builds the same tool schema.
+    """
+    name = fn.__name__
+    skip = {n for n, p in inspect.signature(fn).parameters.items() if "Context" in str(p.annotation)}
+
+    def args_size(kwargs) -> int:
+        return payload_size({k: v for k, v in kwargs.items() if k not in skip})
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result, failed = None, True
+            try:
+                result = await fn(*args, **kwargs)
+                failed = is_error(result)
+                return result
+            finally:
+                metrics.observe(kind, name, (time.perf_counter() - start) * 1000,
+                                args_size(kwargs), payload_size(result), failed)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result, failed = None, True
+            try:
+                result = fn(*args, **kwargs)
+                failed = is_error(result)
+                return result
+            finally:
+                metrics.observe(kind, name, (time.perf_counter() - start) * 1000,
+                                args_size(kwargs), payload_size(result), failed)
+    return wrapper
+
+
+class MetricsDumper:
+    """
+    Writes the metrics to `path` every `interval` seconds and at exit:
+    Prometheus text (replacing the file) if the path ends in .prom,
+    otherwise one JSON snapshot per line appended to it.
+    """
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 60, prefix: str = "mcp"):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="metrics-dump", daemon=True)
+
+    def start(self) -> "MetricsDumper":
+        self.thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def _loop(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def dump(self) -> None:
+        try:
+            if self.path.endswith(".prom"):
+                atomic_write(self.path, [self.metrics.prometheus(self.prefix)])
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self.metrics.snapshot()) + "\n")
+        except OSError:
+            pass
+
+    def stop(self) -> None:
+        if not self.stopped.is_set():
+            self.stopped.set()
+            self.dump()
@@ -0,0 +1,341 @@
+import os
+import re
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional, Tuple
+
+from file_engine import atomic_write
+
+
+class PatchError(ValueError):
+    """Raised when a patch can't be parsed or one of its hunks doesn't apply."""
+
+
+class Hunk:
+    """
+    One change: `ops` is a list of (tag, line) with tag " " (context),
+    "-" (removed) or "+" (added). `hint` is the 0-based line the change is
+    expected at, if the patch says.
+    """
+
+    def __init__(self, ops: List[Tuple[str, str]], hint: Optional[int] = None):
+        self.ops = ops
+        self.hint = hint
+
+    @property
+    def old(self) -> List[str]:
+        return [line for tag, line in self.ops if tag != "+"]
+
+
+class FilePatch:
+    def __init__(self, path: Optional[str], hunks: List[Hunk], create: bool = False, delete: bool = False):
+        self.path = path
+        self.hunks = hunks
+        self.create = create
+        self.delete = delete
+
+
+# -- parsing --
+
+HUNK_HEADER = re.compile(r"^@@+ ?(?:-(\d+)(?:,\d+)? \+\d+(?:,\d+)? )?@@")
+SEARCH, DIVIDER, REPLACE = re.compile(r"^<{5,9} ?SEARCH"), re.compile(r"^={5,9}\s*$"), re.compile(r"^>{5,9} ?REPLACE")
+IGNORED = ("diff ", "index ", "new file mode", "deleted file mode", "old mode", "new mode", "similarity ", "rename ")
+
+
+def split_lines(text: str) -> List[str]:
+    """
+    Lines without their endings, splitting only on "\n" and "\r\n".
+    (str.splitlines() also splits on form feeds, \x1c-\x1e, \u2028 and
+    more, which would turn those characters into newlines when the file is
+    written back.)
+    """
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+
+def _diff_path(line: str) -> Optional[str]:
+    path = line[4:].split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def parse_unified(text: str) -> List[FilePatch]:
+    files: List[FilePatch] = []
+    current: Optional[FilePatch] = None
+    hunk: Optional[Hunk] = None
+    lines = split_lines(text)
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            old, new = _diff_path(line), _diff_path(lines[i + 1])
+            current = FilePatch(new or old, [], create=old is None, delete=new is None)
+            files.append(current)
+            hunk = None
+            i += 2
+            continue
+        header = HUNK_HEADER.match(line)
+        if header:
+            if current is None:
+                current = FilePatch(None, [])
+                files.append(current)
+            start = header.group(1)
+            hunk = Hunk([], max(int(start) - 1, 0) if start is not None else None)
+            current.hunks.append(hunk)
+        elif hunk is not None and not line.startswith("\\"):
+            if line[:1] in (" ", "-", "+"):
+                hunk.ops.append((line[0], line[1:]))
+            elif not line.strip():
+                hunk.ops.append((" ", ""))   # blank context lines often lose their leading space
+            elif line.startswith(IGNORED):
+                hunk = None
+            else:
+                raise PatchError(f"unexpected line in hunk: {line[:80]!r}")
+        i += 1
+    for f in files:
+        # Trailing blank "context" is usually just the end of the message
+        for h in f.hunks:
+            while h.ops and h.ops[-1] == (" ", ""):
+                h.ops.pop()
+    return files
+
+
+def _looks_like_path(line: str) -> bool:
+    line = line.strip().strip("`*:")
+    return bool(line) and " " not in line and ("." in line or "/" in line)
+
+
+def parse_search_replace(text: str) -> List[FilePatch]:
+    """
+    Blocks of
+        path/to/file.py          (optional)
+        <<<<<<< SEARCH
+        old lines
+        =======
+        new lines
+        >>>>>>> REPLACE
+    An empty SEARCH part appends to the file (creating it if needed).
+    """
+    files: Dict[Optional[str], FilePatch] = {}
+    lines = split_lines(text)
+    path: Optional[str] = None
+    i = 0
+    while i < len(lines):
+        if not SEARCH.match(lines[i]):
+            if _looks_like_path(lines[i]) and not lines[i].startswith("```"):
+                path = lines[i].strip().strip("`*:")
+            i += 1
+            continue
+        old, new = [], []
+        i += 1
+        while i < len(lines) and not DIVIDER.match(lines[i]):
+            old.append(lines[i])
+            i += 1
+        i += 1
+        while i < len(lines) and not REPLACE.match(lines[i]):
+            new.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise PatchError("SEARCH/REPLACE block is missing its ======= or >>>>>>> REPLACE line")
+        i += 1
+        ops = [("-", line) for line in old] + [("+", line) for line in new]
+        files.setdefault(path, FilePatch(path, [], create=not old)).hunks.append(Hunk(ops))
+    return list(files.values())
+
+
+def parse_patch(text: str, default_path: Optional[str] = None) -> List[FilePatch]:
+    """Parse a unified diff or SEARCH/REPLACE blocks into per-file hunks."""
+    if any(SEARCH.match(line) for line in split_lines(text)):
+        files = parse_search_replace(text)
+    else:
+        files = parse_unified(text)
+    files = [f for f in files if f.hunks or f.delete]
+    if not files:
+        raise PatchError("no hunks found; expected a unified diff or SEARCH/REPLACE blocks")
+    for f in files:
+        if default_path and (f.path is None or len(files) == 1):
+            f.path = default_path
+        if not f.path:
+            raise PatchError("the patch doesn't name the file; pass filename")
+    return files
+
+
+# -- matching --
+
+def _squash(line: str) -> str:
+    return " ".join(line.split())
+
+
+class Matcher:
+    """
+    Finds where hunks go in a file, trying increasingly loose comparisons:
+    exact lines, then lines equal up to whitespace, then windows whose text
+    is at least `similarity` alike (difflib ratio). Matches never overlap.
+    """
+
+    def __init__(self, lines: List[str], similarity: float = 0.85):
+        self.lines = lines
+        self.similarity = similarity
+        self._squashed: Optional[List[str]] = None
+        self.claimed: List[Tuple[int, int]] = []
+
+    @property
+    def squashed(self) -> List[str]:
+        if self._squashed is None:
+            self._squashed = [_squash(line) for line in self.lines]
+        return self._squashed
+
+    def _free(self, start: int, end: int) -> bool:
+        return all(end <= a or start >= b for a, b in self.claimed)
+
+    def _candidates(self, old: List[str]) -> Tuple[List[int], str]:
+        n, size = len(self.lines), len(old)
+        starts = range(n - size + 1)
+        exact = [i for i in starts if self.lines[i] == old[0] and self.lines[i:i + size] == old]
+        if exact:
+            return exact, "exact"
+        squashed_old = [_squash(line) for line in old]
+        loose = [i for i in starts if self.squashed[i:i + size] == squashed_old]
+        if loose:
+            return loose, "whitespace"
+        target = "\n".join(squashed_old)
+        matcher = SequenceMatcher(autojunk=False)
+        matcher.set_seq2(target)
+        best, best_ratio = [], self.similarity
+        for i in starts:
+            matcher.set_seq1("\n".join(self.squashed[i:i + size]))
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = [i], ratio
+            elif ratio == best_ratio:
+                best.append(i)
+        return best, f"fuzzy ({best_ratio:.0%} similar)"
+
+    def locate(self, hunk: Hunk, after: int) -> Tuple[int, str]:
+        """Start line for `hunk`, preferring the patch's line hint, else the first match after `after`."""
+        old = hunk.old
+        if not old:
+            start = len(self.lines) if hunk.hint is None else min(hunk.hint, len(self.lines))
+            return start, "exact"
+        candidates, how = self._candidates(old)
+        candidates = [i for i in candidates if self._free(i, i + len(old))]
+        if not candidates:
+            raise PatchError(f"no match for:\n{self._preview(old)}{self._closest(old)}")
+        if hunk.hint is not None:
+            start = min(candidates, key=lambda i: abs(i - hunk.hint))
+        elif how.startswith("fuzzy") and len(candidates) > 1:
+            raise PatchError(f"only approximate matches, at lines {candidates[:5]}; add more context for:\n"
+                             f"{self._preview(old)}")
+        else:
+            start = next((i for i in candidates if i >= after), candidates[0])
+        self.claimed.append((start, start + len(old)))
+        return start, how
+
+    @staticmethod
+    def _preview(lines: List[str], limit: int = 8) -> str:
+        shown = "\n".join(f"  {line}" for line in lines[:limit])
+        return shown + (f"\n  ... ({len(lines) - limit} more lines)" if len(lines) > limit else "")
+
+    def _closest(self, old: List[str]) -> str:
+        """Where the hunk's first line (or something like it) does occur, to help the caller fix the patch."""
+        first = _squash(old[0])
+        if not first:
+            return ""
+        for i, line in enumerate(self.squashed):
+            if line == first:
+                return f"\nthe first line occurs at line {i}; the file there reads:\n{self._preview(self.lines[i:i + len(old)])}"
+        return ""
+
+
+def patch_lines(lines: List[str], hunks: List[Hunk], similarity: float = 0.85) -> Tuple[List[str], List[str]]:
+    """
+    Apply hunks to a file's lines (without line endings). Every hunk is
+    located before anything changes; returns the new lines and a note for
+    each hunk that needed a loose match.
+    """
+    matcher = Matcher(lines, similarity)
+    placed, notes, after = [], [], 0
+    for n, hunk in enumerate(hunks, 1):
+        try:
+            start, how = matcher.locate(hunk, after)
+        except PatchError as e:
+            raise PatchError(f"hunk {n}: {e}") from None
+        if how != "exact":
+            notes.append(f"hunk {n} at line {start}: {how}")
+        placed.append((start, hunk))
+        after = start + len(hunk.old)
+
+    out: List[str] = []
+    pos = 0
+    for start, hunk in sorted(placed, key=lambda p: p[0]):
+        out.extend(lines[pos:start])
+        pos = start
+        for tag, text in hunk.ops:
+            if tag == " ":
+                out.append(lines[pos])   # keep the file's own context line
+                pos += 1
+            elif tag == "-":
+                pos += 1
+            else:
+                out.append(text)
+    out.extend(lines[pos:])
+    return out, notes
+
+
+def _read(path: str) -> Tuple[List[str], str, bool]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        text = f.read()
+    eol = "\r\n" if "\r\n" in text else "\n"
+    return split_lines(text), eol, text.endswith("\n")
+
+
+def patch_files(patch: str, resolve: Callable[[str], str], default_path: Optional[str] = None,
+                check: bool = False, similarity: float = 0.85) -> List[dict]:
+    """
+    Parse `patch` and apply it to the files it names (`resolve` maps a patch
+    path to a real one). All hunks of all files are validated first; nothing
+    is written unless every one of them applies. Each file is then replaced
+    atomically. With check=True nothing is written at all.
+
+    Sections naming the same file (e.g. concatenated `git diff` output) are
+    applied one after another, each to the result of the previous ones.
+    """
+    files = parse_patch(patch, default_path)
+    # path -> [exists, lines, eol, final newline], as left by the sections applied so far
+    state: Dict[str, list] = {}
+    originally: Dict[str, bool] = {}
+    results = []
+    for f in files:
+        path = resolve(f.path)
+        if path not in state:
+            exists = originally[path] = os.path.exists(path)
+            state[path] = [exists, *(_read(path) if exists else ([], "\n", True))]
+        current = state[path]
+        exists, lines, eol, final_newline = current
+        if f.delete:
+            if not exists:
+                raise PatchError(f"{f.path}: cannot delete, file does not exist")
+            current[:] = [False, [], eol, True]
+            results.append({"path": path, "name": f.path, "delete": True, "hunks": 0, "notes": []})
+            continue
+        if not exists and not f.create:
+            raise PatchError(f"{f.path}: file does not exist")
+        try:
+            new_lines, notes = patch_lines(lines, f.hunks, similarity)
+        except PatchError as e:
+            raise PatchError(f"{f.path}: {e}") from None
+        current[:] = [True, new_lines, eol, final_newline or not lines]
+        results.append({"path": path, "name": f.path, "delete": False, "hunks": len(f.hunks), "notes": notes})
+
+    if check:
+        return results
+    for path, (exists, lines, eol, final_newline) in state.items():
+        if exists:
+            atomic_write(path, [eol.join(lines) + (eol if lines and final_newline else "")])
+        elif originally[path]:
+            os.remove(path)
+    return results
@@ -0,0 +1,209 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Appended to the user's query in pipelined mode so the planner's answer can
+# be parsed task by task while it is still being generated.
+PLAN_FORMAT = """
+
+Write the final plan as a list of tasks, one JSON object per line and nothing else on that line:
+{"id": 1, "title": "short title", "details": "what to build and how", "depends_on": []}
+Number tasks from 1. depends_on lists the ids of earlier tasks that must be finished first;
+leave it empty when the task can be done independently. Output each task line as soon as it is decided."""
+
+
+# Tools that move the MCP session's cwd. In pipelined mode the planner and
+# every running task share one session, so a change_directory in one of them
+# would change how relative paths resolve in the others mid-task; these tools
+# are left out of the pipelined agents and all paths stay relative to the root.
+CWD_TOOLS = {"change_directory"}
+
+
+class Task:
+    def __init__(self, id: int, title: str, details: str = "", depends_on: Optional[List[int]] = None):
+        self.id = id
+        self.title = title
+        self.details = details
+        self.depends_on = [d for d in (depends_on or []) if d != id]
+        self.status = "pending"   # pending -> running -> done | failed | skipped
+        self.result = None
+
+    def describe(self) -> str:
+        return f"{self.id}. {self.title}" + (f"\n{self.details}" if self.details else "")
+
+
+class PlanParser:
+    """Turns streamed planner text into Tasks, one complete JSON line at a time."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.seen = set()
+
+    def feed(self, text: str) -> List[Task]:
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        return [t for t in map(self._parse, lines) if t is not None]
+
+    def close(self) -> List[Task]:
+        line, self.buffer = self.buffer, ""
+        task = self._parse(line)
+        return [task] if task is not None else []
+
+    def _parse(self, line: str) -> Optional[Task]:
+        line = line.strip().strip("`").rstrip(",")
+        if line.startswith(("- ", "* ")):
+            line = line[2:]
+        if not line.startswith("{"):
+            return None
+        try:
+            data = json.loads(line)
+            task_id = int(data["id"])
+        except (ValueError, KeyError, TypeError):
+            return None
+        if task_id in self.seen:
+            return None
+        self.seen.add(task_id)
+        deps = []
+        for d in data.get("depends_on") or []:
+            try:
+                deps.append(int(d))
+            except (TypeError, ValueError):
+                pass
+        return Task(task_id, str(data.get("title", f"Task {task_id}")), str(data.get("details", "")), deps)
+
+
+class TaskScheduler:
+    """
+    Runs tasks as soon as their dependencies are done, up to max_parallel at
+    once, while more tasks may still be arriving from the planner.
+
+    Dependents of a failed task are skipped. Once planning has finished,
+    dependencies on ids that were never planned count as met, and if only
+    blocked tasks remain (a cycle) the lowest id is run anyway.
+    """
+
+    def __init__(self, run_task: Callable[[Task], Awaitable], max_parallel: int = 2):
+        self.run_task = run_task
+        self.max_parallel = max(1, max_parallel)
+        self.tasks: Dict[int, Task] = {}
+        self.running: Dict[int, asyncio.Task] = {}
+        self.planning_done = False
+        self.idle = asyncio.Event()
+
+    def add(self, task: Task) -> None:
+        self.tasks[task.id] = task
+        self.idle.clear()
+        self._dispatch()
+
+    def finish_planning(self) -> None:
+        self.planning_done = True
+        self._dispatch()
+
+    def _state(self, task: Task) -> str:
+        """'ready', 'blocked' or 'skip' for a pending task."""
+        for dep in task.depends_on:
+            other = self.tasks.get(dep)
+            if other is None:
+                if not self.planning_done:
+                    return "blocked"
+            elif other.status in ("failed", "skipped"):
+                return "skip"
+            elif other.status != "done":
+                return "blocked"
+        return "ready"
+
+    def _dispatch(self) -> None:
+        changed = True
+        while changed:
+            changed = False
+            pending = sorted((t for t in self.tasks.values() if t.status == "pending"), key=lambda t: t.id)
+            for task in pending:
+                state = self._state(task)
+                if state == "skip":
+                    task.status = "skipped"
+                    changed = True
+                elif state == "ready" and len(self.running) < self.max_parallel:
+                    self._start(task)
+            pending = [t for t in pending if t.status == "pending"]
+            if self.planning_done and pending and not self.running:
+                self._start(pending[0])
+
+        if self.planning_done and not self.running and all(t.status != "pending" for t in self.tasks.values()):
+            self.idle.set()
+
+    def _start(self, task: Task) -> None:
+        task.status = "running"
+        self.running[task.id] = asyncio.create_task(self._run(task))
+
+    async def _run(self, task: Task) -> None:
+        try:
+            task.result = await self.run_task(task)
+            task.status = "done"
+        except asyncio.CancelledError:
+            task.status = "failed"
+            raise
+        except Exception as e:
+            task.result = e
+            task.status = "failed"
+        finally:
+            self.running.pop(task.id, None)
+            self._dispatch()
+
+    async def wait(self) -> None:
+        await self.idle.wait()
+
+    def cancel(self) -> None:
+        for running in list(self.running.values()):
+            running.cancel()
+
+
+def task_prompt(query: str, task: Task, tasks: Dict[int, Task]) -> str:
+    """Message handed to the implementation agent for one task."""
+    finished = [t for t in sorted(tasks.values(), key=lambda t: t.id) if t.status == "done"]
+    lines = [
+        f"Overall request: {query}",
+        "",
+        "You are implementing one task of a larger plan. Only do this task:",
+        task.describe(),
+    ]
+    if finished:
+        lines += ["", "Already completed tasks:"] + [f"- {t.id}. {t.title}" for t in finished]
+    return "\n".join(lines)
+
+
+async def run_pipelined(
+    query: str,
+    plan: Callable[[Callable[[str], None]], Awaitable],
+    implement: Callable[[Task, str], Awaitable],
+    max_parallel: int = 2,
+    fallback: Optional[Callable[[object], str]] = None,
+) -> Dict[int, Task]:
+    """
+    Overlap planning and implementation.
+
+    `plan(on_text)` runs the planner and must call on_text with every chunk of
+    text it produces; each completed task line is scheduled immediately.
+    `implement(task, prompt)` runs the implementation agent for one task.
+    If the planner produced no task lines, its result is passed through
+    `fallback` and implemented as a single task (the non-pipelined handoff).
+    """
+    parser = PlanParser()
+    scheduler = TaskScheduler(lambda task: implement(task, task_prompt(query, task, scheduler.tasks)), max_parallel)
+
+    def on_text(text: str) -> None:
+        for task in parser.feed(text):
+            scheduler.add(task)
+
+    try:
+        result = await plan(on_text)
+        for task in parser.close():
+            scheduler.add(task)
+        if not scheduler.tasks:
+            handoff = fallback(result) if fallback else str(result)
+            scheduler.add(Task(1, "Implement the plan", handoff))
+        scheduler.finish_planning()
+        await scheduler.wait()
+    except BaseException:
+        scheduler.cancel()
+        raise
+    return scheduler.tasks
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import os
+import sys
+from typing import Optional
+
+from supervisor import kill_tree
+
+# Characters of a script's exception message the worker sends back
+MAX_ERROR = 4096
+
+# Code run by each warm worker. The interpreter is already up and waiting on
+# stdin when a job arrives, so the only per-job cost is compiling the script.
+# Each worker runs exactly one job and exits, which keeps jobs isolated.
+WORKER_SOURCE = r'''
+import json, os, sys, tempfile, traceback
+
+MAX_ERROR = %d
+
+line = sys.stdin.readline()
+if not line:
+    sys.exit(0)
+job = json.loads(line)
+
+reply = os.fdopen(os.dup(1), "w", encoding="utf-8", errors="backslashreplace")
+out, err = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+os.dup2(out.fileno(), 1)
+os.dup2(err.fileno(), 2)
+sys.stdin = open(os.devnull)
+
+try:
+    import resource
+    if job.get("cpu_seconds"):
+        used = int(resource.getrusage(resource.RUSAGE_SELF).ru_utime)
+        limit = used + int(job["cpu_seconds"])
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 1))
+    if job.get("memory_mb"):
+        limit = int(job["memory_mb"]) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+except (ImportError, ValueError, OSError):
+    pass
+
+result = {"success": False, "error": ""}
+path = job["path"]
+try:
+    os.chdir(job["cwd"])
+    sys.path.insert(0, os.path.dirname(path))
+    sys.argv = [path]
+    with open(path, "r") as f:
+        code = compile(f.read(), path, "exec")
+    exec(code, {"__name__": "__main__", "__file__": path})
+    result["success"] = True
+except SystemExit as e:
+    result["success"] = e.code in (None, 0)
+    if not result["success"]:
+        result["error"] = f"SystemExit: {e.code}"[:MAX_ERROR]
+except BaseException as e:
+    result["error"] = f"{type(e).__name__}: {str(e)}"[:MAX_ERROR]
+    traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+
+sys.stdout.flush()
+sys.stderr.flush()
+limit = job.get("max_output", 65536)
+for name, f in (("output", out), ("stderr", err)):
+    size = f.seek(0, 2)
+    f.seek(max(size - limit, 0))
+    text = f.read().decode("utf-8", errors="replace")
+    if size > limit:
+        text = f"[output truncated: first {size - limit} bytes dropped]\n" + text
+    result[name] = text
+reply.write(json.dumps(result, ensure_ascii=False) + "\n")
+reply.flush()
+os._exit(0)
+''' % MAX_ERROR
+
+
+class PythonWorkerPool:
+    """
+    Pool of pre-started Python interpreters for running short scripts.
+
+    A script is handed to an idle worker, which runs it with CPU/memory
+    rlimits and its own captured stdout/stderr; the parent enforces the
+    wall-clock timeout by killing the worker. Workers are single-use and a
+    replacement is started in the background, so every job gets a fresh
+    interpreter without paying interpreter startup on the request path.
+    """
+
+    def __init__(self, size: int = 2, memory_mb: int = 1024, max_output: int = 64 * 1024):
+        self.size = size
+        self.memory_mb = memory_mb
+        self.max_output = max_output
+        self.idle: Optional[asyncio.Queue] = None
+        # The reply is JSON of stdout and stderr (max_output bytes each) and the
+        # error; escaping can turn every byte into up to 6 ("\u0001").
+        self.reply_limit = 6 * (2 * max_output + MAX_ERROR) + 4096
+        self._pending = set()
+
+    async def _spawn(self):
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "-u", "-c", WORKER_SOURCE,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=(os.name != "nt"),
+            limit=self.reply_limit,
+        )
+
+    async def _replenish(self) -> None:
+        try:
+            self.idle.put_nowait(await self._spawn())
+        except Exception:
+            pass
+
+    def _refill(self) -> None:
+        missing = self.size - self.idle.qsize() - len(self._pending)
+        for _ in range(max(missing, 0)):
+            task = asyncio.create_task(self._replenish())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    def start(self) -> None:
+        """
+        Start warming `size` workers now rather than on the first run().
+        Must be called from the event loop; calling it again only tops the
+        pool up.
+        """
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+        self._refill()
+
+    async def _acquire(self):
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+        while not self.idle.empty():
+            worker = self.idle.get_nowait()
+            if worker.returncode is None:
+                return worker
+        # Nothing warm yet (first call or a burst of parallel jobs): start one now.
+        return await self._spawn()
+
+    async def run(self, path: str, cwd: str, timeout: float = 15, memory_mb: Optional[int] = None) -> dict:
+        """
+        Run the script at `path` in a worker and return its result.
+
+        Returns a dict with success, output (stdout), stderr and error.
+        """
+        worker = await self._acquire()
+        self._refill()   # replace the worker this job consumes
+        job = {
+            "path": path,
+            "cwd": cwd,
+            "cpu_seconds": max(int(timeout) + 1, 1),
+            "memory_mb": memory_mb or self.memory_mb,
+            "max_output": self.max_output,
+        }
+        try:
+            worker.stdin.write((json.dumps(job) + "\n").encode())
+            await worker.stdin.drain()
+            line = await asyncio.wait_for(worker.stdout.readline(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._kill(worker)
+            await worker.wait()
+            return {"success": False, "output": "", "stderr": "",
+                    "error": f"TimeoutError: script exceeded {timeout} seconds and was killed"}
+        except ValueError:   # the reply overran reply_limit; shouldn't happen, but don't fail opaquely
+            self._kill(worker)
+            await worker.wait()
+            return {"success": False, "output": "", "stderr": "",
+                    "error": f"Worker reply exceeded {self.reply_limit} bytes"}
+        except (asyncio.CancelledError, Exception):
+            self._kill(worker)
+            raise
+        finally:
+            if worker.stdin and not worker.stdin.is_closing():
+                worker.stdin.close()
+
+        await worker.wait()
+        if not line:
+            return {"success": False, "output": "", "stderr": "",
+                    "error": f"Worker died (exit code {worker.returncode}); CPU or memory limit exceeded?"}
+        return json.loads(line)
+
+    def _kill(self, worker) -> None:
+        kill_tree(worker)
+
+    async def shutdown(self) -> None:
+        if self.idle is None:
+            return
+        while not self.idle.empty():
+            worker = self.idle.get_nowait()
+            self._kill(worker)
+            await worker.wait()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from file_engine import atomic_write
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire after `ttl` seconds.
+
+    With `path` set, entries are loaded from and saved to a JSON file so
+    results survive server restarts.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.data: "OrderedDict[str, tuple]" = OrderedDict()
+        if path:
+            self._load()
+
+    def get(self, key: str):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.time():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value) -> None:
+        self.data[key] = (time.time() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_entries:
+            self.data.popitem(last=False)
+        if self.path:
+            self._save()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, expires, value in entries[-self.max_entries:]:
+            if expires > now:
+                self.data[key] = (expires, value)
+
+    def _save(self) -> None:
+        entries = [[key, expires, value] for key, (expires, value) in self.data.items()]
+        try:
+            atomic_write(self.path, [json.dumps(entries)])
+        except OSError:
+            pass
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` calls per second on average, bursts up to `burst`."""
+
+    def __init__(self, rate: float = 1.0, burst: int = 3):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CachedSearch:
+    """
+    Async front for a blocking search function.
+
+    Results are cached by normalized query, concurrent calls for the same
+    query share one backend request, and backend calls are rate limited and
+    run in a thread so they never block the event loop. `backend` is any
+    callable taking the query string, which makes it easy to swap in a stub.
+    """
+
+    def __init__(
+        self,
+        backend: Callable[[str], str],
+        cache: Optional[TTLCache] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.backend = backend
+        self.cache = cache or TTLCache()
+        self.limiter = limiter or RateLimiter()
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    async def search(self, query: str) -> str:
+        key = self.normalize(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # The fetch belongs to the cache, not to the caller that started it:
+            # cancelling any caller (the first one included) leaves it running
+            # for the others, and its result still lands in the cache.
+            task = self.inflight[key] = asyncio.create_task(self._fetch(key, query))
+            task.add_done_callback(self._finished)
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, query: str) -> str:
+        try:
+            await self.limiter.acquire()
+            result = await asyncio.to_thread(self.backend, query)
+            self.cache.set(key, result)
+            return result
+        finally:
+            del self.inflight[key]
+
+    @staticmethod
+    def _finished(task: asyncio.Task) -> None:
+        # Mark a failure retrieved so one whose callers were all cancelled isn't logged
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,110 @@
+import itertools
+import os
+import re
+import weakref
+from typing import Dict, Optional
+
+from supervisor import ProcessSupervisor, kill_tree
+
+# HTTP clients can send this header to name their session. A named session's
+# state (cwd, processes) survives reconnects; an anonymous one ends with its
+# MCP session and its processes are killed.
+SESSION_HEADER = "x-workspace-session"
+
+
+class WorkspaceSession:
+    """State of one agent session: its workspace root, current directory and processes."""
+
+    def __init__(self, name: str, root: str):
+        self.name = name
+        self.root = os.path.abspath(root)
+        self.cwd = self.root
+        self.supervisor = ProcessSupervisor()
+
+    def path(self, relative: str) -> str:
+        """
+        Resolve a tool path against the session's current directory. Raises
+        ValueError if it points outside the session's root (../, absolute
+        paths), so no tool can reach another session's files.
+        """
+        full = os.path.join(self.cwd, relative)
+        if not self.contains(full):
+            raise ValueError(f"Path {relative!r} is outside the workspace directory.")
+        return full
+
+    def contains(self, path: str) -> bool:
+        return os.path.commonpath([self.root, os.path.abspath(path)]) == self.root
+
+    def chdir(self, path: str) -> str:
+        new_path = os.path.abspath(self.path(path))
+        if not os.path.isdir(new_path):
+            raise ValueError(f"Directory does not exist: {new_path}")
+        self.cwd = new_path
+        return new_path
+
+
+def _kill_all(supervisor: ProcessSupervisor) -> None:
+    # Runs from a weakref finalizer, so it can't await supervisor.stop()
+    for proc in list(supervisor.processes.values()):
+        if proc.running:
+            kill_tree(proc.process)
+
+
+class SessionManager:
+    """
+    Maps MCP client sessions to WorkspaceSessions, so one server can serve
+    many agents at once without them sharing a cwd or seeing each other's
+    processes.
+
+    All sessions share `root` unless `isolate` is set, in which case each
+    gets its own directory root/sessions/<name>.
+    """
+
+    def __init__(self, root: str, isolate: bool = False):
+        self.root = os.path.abspath(root)
+        self.isolate = isolate
+        self.default = WorkspaceSession("default", self.root)
+        self.by_client: "weakref.WeakKeyDictionary[object, WorkspaceSession]" = weakref.WeakKeyDictionary()
+        self.named: Dict[str, WorkspaceSession] = {}
+        self.ids = itertools.count(1)
+
+    def _create(self, name: str) -> WorkspaceSession:
+        root = self.root
+        if self.isolate:
+            root = os.path.join(self.root, "sessions", name)
+            os.makedirs(root, exist_ok=True)
+        return WorkspaceSession(name, root)
+
+    @staticmethod
+    def requested_name(ctx) -> Optional[str]:
+        request = getattr(ctx.request_context, "request", None)
+        headers = getattr(request, "headers", None)
+        name = headers.get(SESSION_HEADER) if headers is not None else None
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)[:64] if name else None
+        # "." or ".." would make an isolated session's root the shared workspace or above it
+        return name if name and name.strip(".") else None
+
+    def get(self, ctx=None) -> WorkspaceSession:
+        """The WorkspaceSession for the client that made this tool call."""
+        try:
+            client = ctx.session
+        except (AttributeError, ValueError):
+            return self.default
+
+        session = self.by_client.get(client)
+        if session is not None:
+            return session
+
+        name = self.requested_name(ctx)
+        if name:
+            session = self.named.get(name)
+            if session is None:
+                session = self.named[name] = self._create(name)
+        elif not self.by_client and not self.isolate:
+            # The first anonymous client (the only one over stdio) uses the default session
+            session = self.default
+        else:
+            session = self._create(f"session-{next(self.ids)}")
+            weakref.finalize(client, _kill_all, session.supervisor)
+        self.by_client[client] = session
+        return session
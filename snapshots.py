@@ -0,0 +1,318 @@
+import difflib
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from file_engine import atomic_write
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+from workspace_index import walk
+
+# Inside the workspace, but in DEFAULT_IGNORES so listings, searches and
+# snapshots themselves skip it.
+SNAPSHOT_DIR = ".snapshots"
+FICLONE = 0x40049409   # Linux ioctl: share the source's extents (btrfs, xfs, ...)
+
+# rel path -> [sha256, size, mtime_ns, mode]
+Manifest = Dict[str, list]
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def clone_file(src: str, dst: str) -> None:
+    """Copy src to dst as a reflink if the filesystem supports it, otherwise a regular copy."""
+    if fcntl is None:
+        shutil.copy2(src, dst)
+        return
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return
+        except OSError:
+            pass
+        shutil.copyfileobj(s, d, 1 << 20)
+
+
+class SnapshotStore:
+    """
+    Snapshots of a workspace in a content-addressed blob store.
+
+    A snapshot is a manifest of path -> (sha256, size, mtime, mode); file
+    contents live once per distinct hash in .snapshots/blobs, so a snapshot
+    only stores files whose content isn't there yet. Files whose size and
+    mtime match the previous snapshot reuse its hash without being read,
+    so taking a snapshot of an unchanged tree is one stat per file.
+    Blobs are reflinked where the filesystem allows and copied otherwise;
+    they are never hardlinked, because tools that rewrite files in place
+    would then change the stored copy too.
+
+    node_modules, .git, virtualenvs and .gitignore'd files are not part of
+    snapshots (they are rebuilt by package managers), and restoring leaves
+    them alone.
+    """
+
+    def __init__(self, root: str, keep: int = 50):
+        self.root = os.path.abspath(root)
+        self.dir = os.path.join(self.root, SNAPSHOT_DIR)
+        self.blobs = os.path.join(self.dir, "blobs")
+        self.manifests = os.path.join(self.dir, "manifests")
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.latest: Optional[Manifest] = None
+
+    # -- scanning --
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        files = {}
+        for rel, is_dir, _ in walk(self.root, ignore=[SNAPSHOT_DIR]):
+            if is_dir:
+                continue
+            try:
+                st = os.lstat(os.path.join(self.root, rel))
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                files[rel] = st
+        return files
+
+    @staticmethod
+    def _same(entry: Optional[list], st: os.stat_result) -> bool:
+        return entry is not None and entry[1] == st.st_size and entry[2] == st.st_mtime_ns
+
+    def _blob(self, digest: str) -> str:
+        return os.path.join(self.blobs, digest[:2], digest)
+
+    def _store(self, path: str) -> str:
+        digest = _hash_file(path)
+        blob = self._blob(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob), prefix=".")
+            os.close(fd)
+            try:
+                clone_file(path, tmp)
+                os.replace(tmp, blob)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return digest
+
+    # -- manifests --
+
+    def _manifest_path(self, snapshot_id: str) -> str:
+        # Ids are numbers; anything else could point outside the manifests directory
+        if not str(snapshot_id).isdigit():
+            raise ValueError(f"invalid snapshot id {snapshot_id!r}; ids are numbers")
+        return os.path.join(self.manifests, f"{snapshot_id}.json")
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.manifests)
+        except FileNotFoundError:
+            return []
+        return sorted((n[:-5] for n in names if n.endswith(".json") and n[:-5].isdigit()), key=int)
+
+    def list_snapshots(self) -> List[dict]:
+        result = []
+        for snapshot_id in self._ids():
+            with open(self._manifest_path(snapshot_id), encoding="utf-8") as f:
+                data = json.load(f)
+            result.append({"id": snapshot_id, "label": data.get("label", ""), "created": data["created"],
+                           "files": len(data["files"])})
+        return result
+
+    def load(self, snapshot_id: str) -> dict:
+        try:
+            with open(self._manifest_path(str(snapshot_id)), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"no snapshot {snapshot_id!r}") from None
+
+    def _previous(self) -> Manifest:
+        if not os.path.isdir(self.blobs):
+            self.latest = {}   # the store was deleted
+        if self.latest is None:
+            ids = self._ids()
+            self.latest = self.load(ids[-1])["files"] if ids else {}
+        return self.latest
+
+    # -- operations --
+
+    def snapshot(self, label: str = "", pinned: Tuple[str, ...] = ()) -> dict:
+        """
+        Record the current workspace; returns the snapshot's id and what
+        changed since the last one. Snapshots in `pinned` survive the pruning
+        of old snapshots this triggers.
+        """
+        with self.lock:
+            start = time.perf_counter()
+            previous = self._previous()
+            files: Manifest = {}
+            changed = 0
+            for rel, st in self._scan().items():
+                entry = previous.get(rel)
+                if self._same(entry, st):
+                    files[rel] = [entry[0], st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode)]
+                    continue
+                try:
+                    digest = self._store(os.path.join(self.root, rel))
+                except OSError:
+                    continue   # deleted or unreadable since the scan
+                files[rel] = [digest, st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode)]
+                changed += 1
+
+            existing = self._ids()
+            snapshot_id = str(int(existing[-1]) + 1 if existing else 1)
+            os.makedirs(self.manifests, exist_ok=True)
+            atomic_write(self._manifest_path(snapshot_id),
+                         [json.dumps({"id": snapshot_id, "label": label, "created": time.time(), "files": files})])
+            self.latest = files
+            self._prune(existing + [snapshot_id], pinned)
+            return {"id": snapshot_id, "files": len(files), "changed": changed,
+                    "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    def restore(self, snapshot_id: str) -> dict:
+        """
+        Make the workspace match a snapshot: rewrite changed files, recreate
+        deleted ones and remove files that didn't exist then. The current
+        state is snapshotted first, so a restore can itself be undone.
+        """
+        snapshot_id = str(snapshot_id)
+        target = self.load(snapshot_id)["files"]
+        # The backup may push the target out of the `keep` newest; it must not be pruned
+        # (and its blobs with it) before it has been restored.
+        backup = self.snapshot(label=f"before restoring {snapshot_id}", pinned=(snapshot_id,))
+        with self.lock:
+            start = time.perf_counter()
+            current = self._scan()
+            written, removed = [], []
+            for rel, (digest, size, mtime_ns, mode) in target.items():
+                st = current.get(rel)
+                if st is not None and st.st_size == size and st.st_mtime_ns == mtime_ns:
+                    continue
+                path = os.path.join(self.root, rel)
+                if st is not None and st.st_size == size and _hash_file(path) == digest:
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+                os.close(fd)
+                try:
+                    clone_file(self._blob(digest), tmp)
+                    os.chmod(tmp, mode)
+                    os.utime(tmp, ns=(mtime_ns, mtime_ns))
+                    os.replace(tmp, path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+                written.append(rel)
+            for rel in current:
+                if rel not in target:
+                    os.unlink(os.path.join(self.root, rel))
+                    removed.append(rel)
+            self._remove_empty_dirs(removed, target)
+            self.latest = dict(target)   # the workspace now matches it
+        return {"id": str(snapshot_id), "written": written, "removed": removed, "backup": backup["id"],
+                "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    def _remove_empty_dirs(self, removed: List[str], target: Manifest) -> None:
+        keep = {os.path.dirname(rel) for rel in target}
+        dirs = {os.path.dirname(rel) for rel in removed}
+        for d in sorted(dirs, key=len, reverse=True):
+            while d and not any(k == d or k.startswith(d + "/") for k in keep):
+                try:
+                    os.rmdir(os.path.join(self.root, d))
+                except OSError:
+                    break
+                d = os.path.dirname(d)
+
+    def diff(self, snapshot_id: str, other: Optional[str] = None) -> Tuple[Dict[str, List[str]], Manifest, Manifest]:
+        """
+        Files added, removed and modified going from the snapshot to `other`
+        (another snapshot id, or the current workspace if None).
+        """
+        old = self.load(snapshot_id)["files"]
+        if other is not None:
+            new = self.load(other)["files"]
+        else:
+            new = {}
+            for rel, st in self._scan().items():
+                entry = old.get(rel)
+                if self._same(entry, st):
+                    new[rel] = entry
+                else:
+                    new[rel] = [None, st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode)]
+        changes: Dict[str, List[str]] = {"added": [], "removed": [], "modified": []}
+        for rel in sorted(set(old) | set(new)):
+            if rel not in old:
+                changes["added"].append(rel)
+            elif rel not in new:
+                changes["removed"].append(rel)
+            elif new[rel][0] != old[rel][0]:
+                if new[rel][0] is None and new[rel][1] == old[rel][1] and \
+                        _hash_file(os.path.join(self.root, rel)) == old[rel][0]:
+                    continue   # touched, not changed
+                changes["modified"].append(rel)
+        return changes, old, new
+
+    def read(self, rel: str, entry: Optional[list]) -> List[str]:
+        """Lines of a file as recorded by a manifest entry (hash None means the live file)."""
+        if entry is None:
+            return []
+        path = self._blob(entry[0]) if entry[0] else os.path.join(self.root, rel)
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            return f.read().splitlines(keepends=True)
+
+    def unified_diff(self, snapshot_id: str, other: Optional[str] = None, max_chars: int = 64 * 1024) -> str:
+        changes, old, new = self.diff(snapshot_id, other)
+        chunks, total = [], 0
+        for rel in changes["modified"] + changes["added"] + changes["removed"]:
+            text = "".join(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n"
+                           for line in difflib.unified_diff(self.read(rel, old.get(rel)),
+                                                            self.read(rel, new.get(rel)), f"a/{rel}", f"b/{rel}"))
+            if total + len(text) > max_chars:
+                chunks.append(f"[diff truncated at {max_chars} characters]\n")
+                break
+            chunks.append(text)
+            total += len(text)
+        return "".join(chunks)
+
+    def _prune(self, ids: List[str], pinned: Tuple[str, ...] = ()) -> None:
+        """Keep the newest `keep` snapshots (and pinned ones) and delete blobs no remaining snapshot uses."""
+        old = [i for i in ids[:-self.keep] if i not in pinned] if len(ids) > self.keep else []
+        if not old:
+            return
+        for snapshot_id in old:
+            os.unlink(self._manifest_path(snapshot_id))
+        used = set()
+        for snapshot_id in (i for i in ids if i not in old):
+            used.update(entry[0] for entry in self.load(snapshot_id)["files"].values())
+        for prefix in os.listdir(self.blobs) if os.path.isdir(self.blobs) else []:
+            for name in os.listdir(os.path.join(self.blobs, prefix)):
+                if name not in used and not name.startswith("."):
+                    os.unlink(os.path.join(self.blobs, prefix, name))
+
+
+_stores: Dict[str, SnapshotStore] = {}
+
+
+def snapshot_store(root: str) -> SnapshotStore:
+    root = os.path.abspath(root)
+    store = _stores.get(root)
+    if store is None:
+        store = _stores[root] = SnapshotStore(root)
+    return store
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import signal
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+# Per-process log capacity; older output is dropped once this fills up.
+DEFAULT_LOG_BYTES = 256 * 1024
+
+
+class RingBuffer:
+    """
+    Bounded byte buffer addressed by absolute offsets.
+
+    `start` is the offset of the oldest byte still kept and `end` the offset
+    just past the newest one, so readers can poll with the offset they got back
+    last time and only see new output.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_LOG_BYTES):
+        self.capacity = capacity
+        self.data = bytearray()
+        self.start = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.data)
+
+    @property
+    def dropped(self) -> int:
+        return self.start
+
+    def write(self, chunk: bytes) -> None:
+        self.data += chunk
+        overflow = len(self.data) - self.capacity
+        if overflow > 0:
+            del self.data[:overflow]
+            self.start += overflow
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> tuple:
+        """Return (bytes, next_offset) starting at offset (clamped to what is kept)."""
+        offset = max(offset, self.start)
+        begin = offset - self.start
+        stop = len(self.data) if limit is None else min(len(self.data), begin + limit)
+        chunk = bytes(self.data[begin:stop])
+        return chunk, offset + len(chunk)
+
+    def tail(self, lines: int) -> bytes:
+        """Return the last `lines` lines kept in the buffer."""
+        pos = len(self.data)
+        if pos and self.data[-1:] == b"\n":
+            pos -= 1
+        for _ in range(lines):
+            pos = self.data.rfind(b"\n", 0, pos)
+            if pos < 0:
+                return bytes(self.data)
+        return bytes(self.data[pos + 1:])
+
+
+class ManagedProcess:
+    """A child process owned by the supervisor, with its drained output."""
+
+    def __init__(self, process, command: str, cwd: str, log_bytes: int, log_file: Optional[str] = None):
+        self.process = process
+        self.pid = process.pid
+        self.command = command
+        self.cwd = cwd
+        self.logs = RingBuffer(log_bytes)
+        self.log_file = log_file
+        self.started_at = time.time()
+        self.ended_at = None
+        self.returncode = None
+        self.timed_out = False
+        self.done = asyncio.Event()
+        self.watcher = None
+        self._ps = None
+
+    @property
+    def running(self) -> bool:
+        return not self.done.is_set()
+
+    def output(self) -> str:
+        return bytes(self.logs.data).decode("utf-8", errors="replace")
+
+    def stats(self) -> dict:
+        """CPU and memory usage of the process tree, if psutil is installed."""
+        if not self.running:
+            return {}
+        try:
+            import psutil
+        except ImportError:
+            return {}
+        try:
+            if self._ps is None:
+                self._ps = psutil.Process(self.pid)
+            procs = [self._ps] + self._ps.children(recursive=True)
+            rss = 0
+            cpu = 0.0
+            for p in procs:
+                try:
+                    rss += p.memory_info().rss
+                    cpu += p.cpu_percent(interval=None)
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+            return {"rss_bytes": rss, "cpu_percent": cpu, "num_processes": len(procs)}
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return {}
+
+    def info(self) -> dict:
+        return {
+            "pid": self.pid,
+            "command": self.command,
+            "cwd": self.cwd,
+            "running": self.running,
+            "returncode": self.returncode,
+            "timed_out": self.timed_out,
+            "uptime": round((self.ended_at or time.time()) - self.started_at, 3),
+            "log_bytes": self.logs.end,
+            **self.stats(),
+        }
+
+
+def kill_tree(process, sig=None) -> None:
+    """Signal a child and everything it spawned (its own process group on POSIX)."""
+    try:
+        if os.name == "nt":
+            process.kill() if sig is None else process.terminate()
+        else:
+            os.killpg(process.pid, sig or signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ProcessSupervisor:
+    """
+    Owns every process spawned by the server tools.
+
+    Each child's stdout/stderr are drained by background reader tasks into a
+    bounded ring buffer, so chatty children never block on a full pipe, and a
+    watcher task waits on the child so it is reaped as soon as it exits.
+    """
+
+    def __init__(self, log_bytes: int = DEFAULT_LOG_BYTES, keep_finished: int = 50):
+        self.log_bytes = log_bytes
+        self.keep_finished = keep_finished
+        self.processes: Dict[int, ManagedProcess] = {}
+
+    async def spawn(
+        self,
+        command: Union[str, List[str]],
+        cwd: str,
+        shell: bool = False,
+        timeout: Optional[float] = None,
+        log_bytes: Optional[int] = None,
+        log_file: Optional[str] = None,
+        on_output: Optional[Callable] = None,
+        env: Optional[dict] = None,
+    ) -> ManagedProcess:
+        """
+        Start a child process under supervision.
+
+        Args:
+            command: Shell string (shell=True) or argv list.
+            cwd: Working directory for the child.
+            timeout: Kill the child after this many seconds (None = no limit).
+            log_bytes: Ring buffer size for this process.
+            log_file: Also append all output to this file.
+            on_output: Optional coroutine called as on_output(stream_name, chunk).
+        """
+        kwargs = dict(
+            cwd=cwd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=(os.name != "nt"),
+            env=env,
+        )
+        if shell:
+            if not isinstance(command, str):
+                command = " ".join(command)
+            process = await asyncio.create_subprocess_shell(command, **kwargs)
+        else:
+            if isinstance(command, str):
+                command = command.split()
+            process = await asyncio.create_subprocess_exec(*command, **kwargs)
+
+        label = command if isinstance(command, str) else " ".join(command)
+        proc = ManagedProcess(process, label, cwd, log_bytes or self.log_bytes, log_file)
+        self.processes[proc.pid] = proc
+        proc.watcher = asyncio.create_task(self._watch(proc, timeout, on_output))
+        self._trim()
+        return proc
+
+    async def _drain(self, proc: ManagedProcess, stream, name: str, sink, on_output) -> None:
+        while True:
+            chunk = await stream.read(4096)
+            if not chunk:
+                break
+            proc.logs.write(chunk)
+            if sink is not None:
+                sink.write(chunk)
+                sink.flush()
+            if on_output is not None:
+                try:
+                    await on_output(name, chunk)
+                except Exception:
+                    pass
+
+    async def _watch(self, proc: ManagedProcess, timeout, on_output) -> None:
+        sink = open(proc.log_file, "ab") if proc.log_file else None
+        process = proc.process
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    self._drain(proc, process.stdout, "stdout", sink, on_output),
+                    self._drain(proc, process.stderr, "stderr", sink, on_output),
+                    process.wait(),
+                ),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            proc.timed_out = True
+            kill_tree(process)
+            await process.wait()
+        except asyncio.CancelledError:
+            kill_tree(process)
+            raise
+        finally:
+            proc.returncode = process.returncode
+            proc.ended_at = time.time()
+            proc.done.set()
+            if sink is not None:
+                sink.close()
+
+    def get(self, pid: int) -> Optional[ManagedProcess]:
+        return self.processes.get(pid)
+
+    async def wait(self, proc: ManagedProcess, timeout: Optional[float] = None) -> bool:
+        """Wait for a process to exit; returns False if it is still running after timeout."""
+        try:
+            await asyncio.wait_for(proc.done.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self, pid: int, grace: float = 3.0) -> Optional[ManagedProcess]:
+        """Terminate a process tree, escalating to SIGKILL after `grace` seconds."""
+        proc = self.processes.get(pid)
+        if proc is None:
+            return None
+        if proc.running:
+            kill_tree(proc.process, signal.SIGTERM)
+            if not await self.wait(proc, grace):
+                kill_tree(proc.process)
+                await self.wait(proc)
+        return proc
+
+    def forget(self, pid: int) -> None:
+        self.processes.pop(pid, None)
+
+    def reap(self) -> List[int]:
+        """Drop finished processes from the table and return their pids."""
+        finished = [pid for pid, p in self.processes.items() if not p.running]
+        for pid in finished:
+            del self.processes[pid]
+        return finished
+
+    def _trim(self) -> None:
+        # Keep at most keep_finished exited processes around for log reads.
+        finished = sorted(
+            (p for p in self.processes.values() if not p.running), key=lambda p: p.ended_at
+        )
+        for p in finished[: max(len(finished) - self.keep_finished, 0)]:
+            del self.processes[p.pid]
+
+    async def shutdown(self) -> None:
+        for pid in list(self.processes):
+            await self.stop(pid, grace=1.0)
@@ -1,46 +1,303 @@
-import sounddevice as sd
-import tempfile
-from scipy.io.wavfile import write
-import google.generativeai as genai
+import asyncio
+import functools
+import io
+import math
 import os
+import queue
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Iterator, List, Optional
 
-import tempfile
-from groq import Groq
-import soundfile as sf
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# sounddevice and groq are only imported when voice is actually used,
+# so importing this module (and agent.py) stays cheap.
+_client = None
 
-client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+SAMPLE_RATE = 16000
+FRAME_MS = 30
 
- 
 
-# Record mic
-def record_audio(duration=7, fs=16000):
-    print("🎤 Listening...")
-    recording = sd.rec(int(duration * fs), samplerate=fs, channels=1, dtype="int16")
-    sd.wait()
-    temp_wav = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-    write(temp_wav.name, fs, recording)
-    return temp_wav.name
-
-
-def transcribe(file_path):
-# Open the audio file
-    with open(file_path, "rb") as file:
-        # Create a translation of the audio file
-        translation = client.audio.translations.create(
-        file=(file_path, file.read()), # Required audio file
-        model="whisper-large-v3", # Required model to use for translation
+def get_client():
+    global _client
+    if _client is None:
+        from groq import Groq
+        _client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+    return _client
+
+
+def encode_wav(pcm: bytes, fs: int = SAMPLE_RATE) -> bytes:
+    """16-bit mono PCM -> WAV file bytes, in memory."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(fs)
+        w.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def rms(frame: bytes) -> float:
+    samples = array("h", frame)
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+# -- audio sources: iterables of 16-bit mono PCM frames --
+
+class MicrophoneSource:
+    """Frames from the default microphone, delivered by a sounddevice.InputStream callback."""
+
+    def __init__(self, fs: int = SAMPLE_RATE, frame_ms: int = FRAME_MS):
+        self.fs = fs
+        self.frame_samples = fs * frame_ms // 1000
+        self.frames: "queue.Queue[bytes]" = queue.Queue()
+        self.stream = None
+
+    def _callback(self, indata, frames, time_info, status) -> None:
+        self.frames.put(indata.tobytes())
+
+    def __iter__(self) -> Iterator[bytes]:
+        import sounddevice as sd
+
+        self.stream = sd.InputStream(samplerate=self.fs, channels=1, dtype="int16",
+                                     blocksize=self.frame_samples, callback=self._callback)
+        with self.stream:
+            while True:
+                yield self.frames.get()
+
+    def close(self) -> None:
+        if self.stream is not None:
+            self.stream.abort()
+
+
+class WavFileSource:
+    """Frames from a 16-bit mono WAV file, for running the pipeline offline."""
+
+    def __init__(self, path: str, frame_ms: int = FRAME_MS, realtime: bool = False):
+        self.path = path
+        self.frame_ms = frame_ms
+        self.realtime = realtime
+        with wave.open(path, "rb") as w:
+            if w.getsampwidth() != 2 or w.getnchannels() != 1:
+                raise ValueError(f"{path}: expected 16-bit mono audio")
+            self.fs = w.getframerate()
+
+    def __iter__(self) -> Iterator[bytes]:
+        frame_samples = self.fs * self.frame_ms // 1000
+        with wave.open(self.path, "rb") as w:
+            while True:
+                frame = w.readframes(frame_samples)
+                if not frame:
+                    return
+                if self.realtime:
+                    time.sleep(self.frame_ms / 1000)
+                yield frame
+
+    def close(self) -> None:
+        pass
+
+
+class Endpointer:
+    """
+    Energy-based voice activity detection on fixed-size frames.
+
+    The noise floor is the quietest average RMS over `window` consecutive
+    frames seen so far (a running minimum, so it settles in the first pause
+    even if the user is already talking when capture starts); a frame counts
+    as speech when its RMS is `ratio` times above it (or above `threshold`
+    if given). The utterance ends after `silence_ms` of non-speech following
+    at least `min_speech_ms` of speech. `is_speech` can replace the energy
+    test, e.g. with webrtcvad.
+    """
+
+    def __init__(self, frame_ms: int = FRAME_MS, silence_ms: int = 800, min_speech_ms: int = 250,
+                 threshold: Optional[float] = None, ratio: float = 3.0, window: int = 5,
+                 is_speech: Optional[Callable[[bytes], bool]] = None):
+        self.frame_ms = frame_ms
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.threshold = threshold
+        self.ratio = ratio
+        self.custom = is_speech
+        self.recent: Deque[float] = deque(maxlen=max(1, window))
+        self.floor: Optional[float] = None
+        self.speech_frames = 0
+        self.quiet_frames = 0
+
+    def is_speech(self, frame: bytes) -> bool:
+        if self.custom is not None:
+            return self.custom(frame)
+        level = rms(frame)
+        if self.threshold is not None:
+            return level > self.threshold
+        self.recent.append(level)
+        if len(self.recent) == self.recent.maxlen:
+            average = sum(self.recent) / len(self.recent)
+            self.floor = average if self.floor is None else min(self.floor, average)
+        if self.floor is None:
+            return False   # still measuring the first window
+        return level > max(self.floor * self.ratio, 300)
+
+    def feed(self, frame: bytes) -> bool:
+        """Update with one frame; returns True when the utterance has ended."""
+        if self.is_speech(frame):
+            self.speech_frames += 1
+            self.quiet_frames = 0
+        else:
+            self.quiet_frames += 1
+        return self.speech_frames >= self.min_speech_frames and self.quiet_frames >= self.silence_frames
+
+    @property
+    def started(self) -> bool:
+        return self.speech_frames >= self.min_speech_frames
+
+
+def transcribe_bytes(audio: bytes, name: str = "speech.wav", client=None, timeout: Optional[float] = None) -> str:
+    """Send in-memory audio for transcription (translated to English)."""
+    options = {"timeout": timeout} if timeout is not None else {}
+    translation = (client or get_client()).audio.translations.create(
+        file=(name, audio),         # Required audio file
+        model="whisper-large-v3",   # Required model to use for translation
         prompt="Specify context or spelling",  # Optional
-        response_format="json",  # Optional
-        temperature=0.0  # Optional
-        )
-        # Print the translation text
-        print(translation.text)
-        
-        return translation.text
+        response_format="json",     # Optional
+        temperature=0.0,            # Optional
+        **options,
+    )
+    return translation.text
+
+
+def listen(source=None, client=None, chunk_seconds: float = 6.0, max_seconds: float = 60.0,
+           lead_in_seconds: float = 10.0, endpointer: Optional[Endpointer] = None, verbose: bool = True,
+           stop: Optional[threading.Event] = None) -> str:
+    """
+    Capture one utterance and return its transcription.
+
+    Stops on `endpointer` silence (or after max_seconds of speech, or
+    lead_in_seconds with no speech at all). While the user is still talking,
+    each completed chunk of about chunk_seconds, cut at a short pause where
+    possible, is already being transcribed in the background, so only the
+    last chunk is left when they stop. Audio never touches the disk.
+
+    source defaults to the microphone; pass a WavFileSource and a stub
+    client (with audio.translations.create) to run it offline. Setting
+    `stop` (from another thread) closes the source within a frame, drops
+    chunks not yet sent and returns "".
+    """
+    source = source or MicrophoneSource()
+    endpointer = endpointer or Endpointer()
+    frame_s = endpointer.frame_ms / 1000
+    fs = getattr(source, "fs", SAMPLE_RATE)
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="transcribe")
+    futures = []
+    chunk: List[bytes] = []
+    spoken = waited = 0.0
+
+    def submit(frames: List[bytes]) -> None:
+        audio = encode_wav(b"".join(frames), fs)
+        futures.append(pool.submit(transcribe_bytes, audio, f"chunk{len(futures)}.wav", client))
+
+    if verbose:
+        print("🎤 Listening...")
+    frames = iter(source)
+    try:
+        for frame in frames:
+            if stop is not None and stop.is_set():
+                break
+            done = endpointer.feed(frame)
+            if not endpointer.started:
+                waited += frame_s
+                chunk = (chunk + [frame])[-10:]   # keep a little audio from before speech starts
+                if waited >= lead_in_seconds:
+                    break
+                continue
+
+            chunk.append(frame)
+            spoken += frame_s
+            if done or spoken >= max_seconds:
+                break
+            # Ship a chunk once it is long enough and the speaker pauses briefly
+            # (or it gets twice as long without a pause)
+            length = len(chunk) * frame_s
+            if (length >= chunk_seconds and endpointer.quiet_frames * frame_s >= 0.2) or length >= 2 * chunk_seconds:
+                submit(chunk)
+                chunk = []
+    finally:
+        source.close()
+        frames.close()
+
+    if stop is not None and stop.is_set():
+        pool.shutdown(wait=False, cancel_futures=True)
+        return ""
+    if endpointer.started and chunk:
+        submit(chunk)
+    try:
+        text = " ".join(t.strip() for t in (f.result() for f in futures) if t and t.strip())
+    finally:
+        pool.shutdown(wait=False)
+    if verbose:
+        print(text)
+    return text
+
+
+# Record mic (fixed length, kept for callers that want raw audio)
+def record_audio(duration=7, fs=SAMPLE_RATE) -> bytes:
+    """Record `duration` seconds from the microphone and return WAV bytes."""
+    recorded = []
+    source = MicrophoneSource(fs)
+    frames = iter(source)
+    print("🎤 Listening...")
+    for frame in frames:
+        recorded.append(frame)
+        if len(recorded) * FRAME_MS >= duration * 1000:
+            break
+    source.close()
+    frames.close()
+    return encode_wav(b"".join(recorded), fs)
+
+
+def transcribe(audio, client=None):
+    """Transcribe WAV bytes or an audio file path."""
+    if isinstance(audio, (bytes, bytearray)):
+        text = transcribe_bytes(bytes(audio), client=client)
+    else:
+        with open(audio, "rb") as file:
+            text = transcribe_bytes(file.read(), os.path.basename(audio), client=client)
+    print(text)
+    return text
+
+
+# -- async API: the blocking capture and HTTP calls run in the default executor --
+
+async def _in_executor(fn, stop: threading.Event, timeout: Optional[float]):
+    future = asyncio.get_running_loop().run_in_executor(None, fn)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        # Tell the worker to stop and give it a moment to release the microphone
+        stop.set()
+        await asyncio.wait([future], timeout=1.0)
+        raise
+
+
+async def alisten(source=None, client=None, timeout: Optional[float] = None, **kwargs) -> str:
+    """
+    listen() without blocking the event loop. Raises asyncio.TimeoutError
+    after `timeout` seconds; on timeout or cancellation capture stops and
+    pending chunk transcriptions are dropped.
+    """
+    stop = threading.Event()
+    return await _in_executor(functools.partial(listen, source, client, stop=stop, **kwargs), stop, timeout)
 
 
- 
+async def atranscribe(audio: bytes, client=None, timeout: Optional[float] = None) -> str:
+    """transcribe_bytes() without blocking the event loop; the request itself also gets `timeout`."""
+    fn = functools.partial(transcribe_bytes, audio, client=client, timeout=timeout)
+    return await _in_executor(fn, threading.Event(), timeout)
@@ -0,0 +1,346 @@
+import fnmatch
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Skipped by recursive listings unless include_ignored is set.
+DEFAULT_IGNORES = ["node_modules", ".git", "__pycache__", ".venv", "venv", ".pytest_cache", ".mypy_cache", ".snapshots"]
+
+
+class DirCache:
+    """
+    Cache of directory listings keyed by path and invalidated by the
+    directory's mtime, which changes whenever an entry is added, removed or
+    renamed (including the temp-file renames done by the write tools).
+    """
+
+    def __init__(self, max_dirs: int = 20000):
+        self.max_dirs = max_dirs
+        self.entries: "OrderedDict[str, Tuple[int, List[Tuple[str, bool]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def listdir(self, path: str) -> List[Tuple[str, bool]]:
+        """Return sorted (name, is_dir) pairs for a directory."""
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.entries.get(path)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            self.entries.move_to_end(path)
+            return cached[1]
+        self.misses += 1
+        with os.scandir(path) as it:
+            listing = sorted((e.name, e.is_dir(follow_symlinks=False)) for e in it)
+        self.entries[path] = (mtime, listing)
+        while len(self.entries) > self.max_dirs:
+            self.entries.popitem(last=False)
+        return listing
+
+
+class IgnoreRules:
+    """A small subset of .gitignore matching: globs, negation, dir-only and anchored patterns."""
+
+    def __init__(self, patterns: List[str], base: str = ""):
+        # base is the directory (relative to the walk root) the patterns came from
+        self.base = base
+        self.rules = []
+        for raw in patterns:
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if line:
+                self.rules.append((re.compile(fnmatch.translate(line)).match, negate, dir_only, anchored))
+
+    def match(self, relpath: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by a negation, None if no rule matched."""
+        if self.base:
+            if not relpath.startswith(self.base + "/"):
+                return None
+            relpath = relpath[len(self.base) + 1:]
+        name = relpath.rsplit("/", 1)[-1]
+        result = None
+        for match, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if match(relpath if anchored else name):
+                result = not negate
+        return result
+
+
+class _GitignoreCache:
+    def __init__(self):
+        self.files = {}
+
+    def rules(self, root: str, reldir: str) -> Optional[IgnoreRules]:
+        path = os.path.join(root, reldir, ".gitignore")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self.files.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                cached = (mtime, IgnoreRules(f.read().splitlines(), reldir))
+            self.files[path] = cached
+        return cached[1]
+
+
+dir_cache = DirCache()
+gitignore_cache = _GitignoreCache()
+
+
+def glob_matcher(patterns: List[str]) -> Callable[[str], bool]:
+    """
+    Compile globs into one predicate over relative paths. Patterns with a "/"
+    match the whole path, the others just the last component.
+    """
+    by_name = [fnmatch.translate(p) for p in patterns if "/" not in p]
+    by_path = [fnmatch.translate(p) for p in patterns if "/" in p]
+    name_re = re.compile("|".join(by_name)).match if by_name else None
+    path_re = re.compile("|".join(by_path)).match if by_path else None
+
+    def matches(relpath: str) -> bool:
+        if name_re is not None and name_re(relpath.rsplit("/", 1)[-1]):
+            return True
+        return path_re is not None and path_re(relpath) is not None
+
+    return matches
+
+
+def walk(
+    root: str,
+    max_depth: Optional[int] = None,
+    ignore: Optional[List[str]] = None,
+    use_gitignore: bool = True,
+    use_defaults: bool = True,
+    include_ignored: bool = False,
+) -> Iterator[Tuple[str, bool, int]]:
+    """
+    Yield (relative_path, is_dir, depth) for everything under root in sorted,
+    depth-first order, using the directory cache.
+
+    Ignored directories are neither yielded nor descended into. The ignore
+    list is `ignore` plus DEFAULT_IGNORES (if use_defaults), and .gitignore
+    files are honored when use_gitignore is set. include_ignored turns all
+    of that off.
+    """
+    patterns = [] if include_ignored else (DEFAULT_IGNORES if use_defaults else []) + list(ignore or [])
+    use_gitignore = use_gitignore and not include_ignored
+    skip = glob_matcher(patterns) if patterns else None
+    yield from _walk(root, "", 0, [], max_depth, skip, use_gitignore)
+
+
+def _walk(root, reldir, depth, rules, max_depth, skip, use_gitignore):
+    try:
+        listing = dir_cache.listdir(os.path.join(root, reldir) if reldir else root)
+    except OSError:
+        return
+    if use_gitignore and (".gitignore", False) in listing:
+        local = gitignore_cache.rules(root, reldir)
+        if local is not None:
+            rules = rules + [local]
+    for name, is_dir in listing:
+        rel = f"{reldir}/{name}" if reldir else name
+        if skip is not None and skip(rel):
+            continue
+        ignored = None
+        for r in rules:
+            verdict = r.match(rel, is_dir)
+            if verdict is not None:
+                ignored = verdict
+        if ignored:
+            continue
+        yield rel, is_dir, depth
+        if is_dir and (max_depth is None or depth + 1 < max_depth):
+            yield from _walk(root, rel, depth + 1, rules, max_depth, skip, use_gitignore)
+
+
+# Files larger than this are not trigram-indexed; they are always scanned.
+MAX_INDEXED_BYTES = 2 * 1024 * 1024
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _required_literals(pattern: str, regex: bool) -> List[str]:
+    """
+    Literal substrings every match must contain, used to pick candidate files.
+    For a regex these are the runs of plain characters in a top-level
+    sequence; anything with top-level alternation gives no constraint.
+    """
+    if not regex:
+        return [pattern]
+    try:
+        import re._parser as sre_parse
+    except ImportError:
+        import sre_parse
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return []
+    literals, run = [], []
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg))
+            continue
+        if op is sre_parse.BRANCH:
+            return []
+        if run:
+            literals.append("".join(run))
+            run = []
+    if run:
+        literals.append("".join(run))
+    return [lit for lit in literals if len(lit) >= 3]
+
+
+class SearchIndex:
+    """
+    Incremental trigram index over the text files under a root directory.
+
+    Each refresh only re-reads files whose size or mtime changed since the
+    last one, and write tools can push changes in directly with update().
+    A search intersects the posting sets of the query's trigrams to get
+    candidate files, then confirms matches line by line.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self.file_trigrams: Dict[str, set] = {}
+        self.postings: Dict[str, set] = defaultdict(set)
+        self.unindexed: set = set()
+        self.lock = threading.Lock()
+
+    def _drop(self, rel: str) -> None:
+        self.files.pop(rel, None)
+        self.unindexed.discard(rel)
+        for gram in self.file_trigrams.pop(rel, ()):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(rel)
+                if not posting:
+                    del self.postings[gram]
+
+    def _index(self, rel: str, st) -> None:
+        self._drop(rel)
+        self.files[rel] = (st.st_size, st.st_mtime_ns)
+        if st.st_size > MAX_INDEXED_BYTES:
+            self.unindexed.add(rel)
+            return
+        try:
+            with open(os.path.join(self.root, rel), "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if b"\0" in data[:8192]:
+            return  # binary: keep the signature so it isn't re-read, but never match it
+        grams = _trigrams(data.decode("utf-8", errors="replace").lower())
+        self.file_trigrams[rel] = grams
+        for gram in grams:
+            self.postings[gram].add(rel)
+
+    def update(self, path: str) -> None:
+        """Re-index (or drop) one file right away, e.g. after a write tool changed it."""
+        rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+        with self.lock:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._drop(rel)
+                return
+            if os.path.isfile(path):
+                self._index(rel, st)
+
+    def refresh(self) -> None:
+        """Bring the index up to date with the files on disk."""
+        with self.lock:
+            seen = set()
+            for rel, is_dir, _ in walk(self.root):
+                if is_dir:
+                    continue
+                seen.add(rel)
+                try:
+                    st = os.stat(os.path.join(self.root, rel))
+                except OSError:
+                    continue
+                if self.files.get(rel) != (st.st_size, st.st_mtime_ns):
+                    self._index(rel, st)
+            for rel in list(self.files):
+                if rel not in seen:
+                    self._drop(rel)
+
+    def candidates(self, literals: List[str]) -> List[str]:
+        found = None
+        for literal in literals:
+            for gram in _trigrams(literal.lower()):
+                posting = self.postings.get(gram, set())
+                found = set(posting) if found is None else found & posting
+                if not found:
+                    break
+        pool = set(self.file_trigrams) if found is None else found
+        return sorted(pool | self.unindexed)
+
+    def search(
+        self,
+        query: str,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        prefix: str = "",
+        glob: Optional[str] = None,
+        max_results: int = 100,
+    ) -> Tuple[List[Tuple[str, int, str]], bool]:
+        """
+        Return ([(relpath, row, line), ...], truncated). Rows are 0-based.
+        Only files under `prefix` (relative to root) matching `glob` are searched.
+        """
+        flags = 0 if case_sensitive else re.IGNORECASE
+        matcher = re.compile(query if regex else re.escape(query), flags)
+        wanted = glob_matcher([glob]) if glob else None
+        self.refresh()
+        with self.lock:
+            files = self.candidates(_required_literals(query, regex))
+        results = []
+        for rel in files:
+            if prefix and not rel.startswith(prefix + "/"):
+                continue
+            if wanted is not None and not wanted(rel):
+                continue
+            try:
+                with open(os.path.join(self.root, rel), "r", encoding="utf-8", errors="replace") as f:
+                    for row, line in enumerate(f):
+                        if matcher.search(line):
+                            results.append((rel, row, line.rstrip("\r\n")))
+                            if len(results) >= max_results:
+                                return results, True
+            except OSError:
+                continue
+        return results, False
+
+
+_search_indexes: Dict[str, SearchIndex] = {}
+
+
+def search_index(root: str) -> SearchIndex:
+    root = os.path.abspath(root)
+    index = _search_indexes.get(root)
+    if index is None:
+        index = _search_indexes[root] = SearchIndex(root)
+    return index
+
+
+def notify_changed(path: str) -> None:
+    """Tell every search index covering `path` that the file was written or deleted."""
+    path = os.path.abspath(path)
+    for root, index in _search_indexes.items():
+        if path.startswith(root + os.sep):
+            index.update(path)